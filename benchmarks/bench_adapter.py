@@ -0,0 +1,392 @@
+# benchmarks/bench_adapter.py
+"""VoceChatAdapter 端到端基准测试。
+
+需要在已安装 AstrBot 的环境中，于插件目录的上一级以模块方式运行，例如在 AstrBot 的
+data/plugins 目录下::
+
+    python -m astrbot_plugin_vocechat.benchmarks.bench_adapter --scenario all
+
+输出每个场景的 Webhook 吞吐 (req/s) 与 p50/p99 延迟、出站消息吞吐，以及进程峰值 RSS。
+使用 --receive-mode stream 时，接收场景改为由模拟服务器通过 SSE 事件流推送消息，
+延迟为从推送到事件提交的端到端耗时。
+
+回放以 record_path 记录的真实流量见 benchmarks/replay.py。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+from astrbot import logger
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Image, Plain
+from astrbot.api.platform import MessageType
+from astrbot.core.platform.astr_message_event import MessageSesion
+
+from ..vocechat_adapter import VoceChatAdapter
+from .fake_vocechat import FakeVoceChatServer
+
+WEBHOOK_SCENARIOS = ("text", "image", "new_users")
+SEND_SCENARIOS = ("send_text", "send_mixed")
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    errors: int
+    elapsed: float
+    throughput: float  # Webhook 场景为 req/s，发送场景为 消息/s
+    p50_ms: float
+    p99_ms: float
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _text_payload(i: int, user_pool: int) -> Dict[str, Any]:
+    return {
+        "mid": i,
+        "from_uid": 1000 + (i % user_pool),
+        "created_at": int(time.time() * 1000),
+        "target": {"gid": 1 + i % 10},
+        "detail": {"type": "normal", "content_type": "text/plain", "content": f"benchmark message {i}", "properties": None},
+    }
+
+
+def _image_payload(i: int, user_pool: int) -> Dict[str, Any]:
+    return {
+        "mid": i,
+        "from_uid": 1000 + (i % user_pool),
+        "created_at": int(time.time() * 1000),
+        "target": {"gid": 1 + i % 10},
+        "detail": {
+            "type": "normal",
+            "content_type": "vocechat/file",
+            "content": f"2024/01/01/bench_{i % 20}.png",
+            "properties": {"name": f"bench_{i % 20}.png", "content_type": "image/png"},
+        },
+    }
+
+
+def _new_user_payload(i: int, user_pool: int) -> Dict[str, Any]:
+    payload = _text_payload(i, user_pool)
+    payload["from_uid"] = 100000 + i  # 每条消息都来自新用户，触发昵称查询
+    return payload
+
+
+PAYLOAD_FACTORIES: Dict[str, Callable[[int, int], Dict[str, Any]]] = {
+    "text": _text_payload,
+    "image": _image_payload,
+    "new_users": _new_user_payload,
+}
+
+
+class AdapterBench:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.fake = FakeVoceChatServer(
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            file_size=args.file_size_kb * 1024,
+            seed=42,
+        )
+        self.tmpdir = tempfile.mkdtemp(prefix="vocechat_bench_")
+        self.event_queue: asyncio.Queue = asyncio.Queue()
+        self.adapter: Optional[VoceChatAdapter] = None
+        self._adapter_task: Optional[asyncio.Task] = None
+        self.webhook_url = ""
+        self._next_mid = 1  # 各场景使用不重复的 mid，避免被去重丢弃
+
+    async def setup(self) -> None:
+        await self.fake.start()
+        port = _free_port()
+        config = {
+            "id": "vocechat_bench",
+            "vocechat_server_url": self.fake.base_url,
+            "api_key": "bench",
+            "webhook_path": "/vocechat_webhook",
+            "webhook_listen_host": "127.0.0.1",
+            "webhook_port": port,
+            "default_bot_self_uid": "1",
+            "ingest_mode": self.args.ingest_mode,
+            "receive_mode": self.args.receive_mode,
+            "attachment_cache_dir": os.path.join(self.tmpdir, "attachments"),
+            "send_global_rate": self.args.send_rate,
+            "send_per_target_rate": self.args.send_rate,
+            "upload_cache_ttl": 0 if self.args.no_upload_cache else 3600,
+            "dedupe_enabled": True,
+        }
+        if self.args.adapter_config:
+            config.update(json.loads(self.args.adapter_config))
+        self.adapter = VoceChatAdapter(config, {}, self.event_queue)
+        self._adapter_task = asyncio.create_task(self.adapter.run())
+        self.webhook_url = f"http://127.0.0.1:{port}/vocechat_webhook"
+        if self.args.receive_mode == "stream":
+            for _ in range(100):
+                if self.adapter.get_event_stream_stats().get("connected"):
+                    return
+                await asyncio.sleep(0.05)
+            raise RuntimeError("事件流未能连接")
+        async with aiohttp.ClientSession() as session:
+            for _ in range(100):
+                try:
+                    async with session.get(self.webhook_url):
+                        return # 有响应即说明已在监听（配置了 webhook_secret 等时验证请求会返回 403）
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.05)
+        raise RuntimeError("Webhook 服务器未能启动")
+
+    async def teardown(self) -> None:
+        if self.adapter:
+            await self.adapter.shutdown()
+        if self._adapter_task:
+            await self._adapter_task
+        await self.fake.stop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    async def _consume_events(self, expected: int, materialize_images: bool, published: Optional[Dict[str, float]] = None, latencies: Optional[List[float]] = None) -> int:
+        consumed = 0
+        while consumed < expected:
+            event = await self.event_queue.get()
+            consumed += 1
+            if published is not None and latencies is not None:
+                published_at = published.get(event.message_obj.message_id)
+                if published_at is not None:
+                    latencies.append(time.perf_counter() - published_at)
+            if materialize_images:
+                # 模拟 LLM 流水线读取图片
+                for component in event.message_obj.message:
+                    if isinstance(component, Image):
+                        try:
+                            await component.convert_to_file_path()
+                        except Exception:
+                            pass
+        return consumed
+
+    async def run_webhook(self, scenario: str) -> ScenarioResult:
+        if self.args.receive_mode == "stream":
+            return await self.run_stream(scenario)
+        total, concurrency = self.args.requests, self.args.concurrency
+        factory = PAYLOAD_FACTORIES[scenario]
+        base = self._next_mid
+        self._next_mid += total
+        payloads = [json.dumps(factory(base + i, self.args.user_pool)).encode("utf-8") for i in range(total)]
+        latencies: List[float] = []
+        errors = 0
+        next_index = 0
+
+        async def client_worker(session: aiohttp.ClientSession) -> None:
+            nonlocal next_index, errors
+            while next_index < total:
+                body = payloads[next_index]
+                next_index += 1
+                started = time.perf_counter()
+                try:
+                    async with session.post(self.webhook_url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        consumer = asyncio.create_task(self._consume_events(total, materialize_images=scenario == "image"))
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(client_worker(session) for _ in range(concurrency)))
+        webhook_elapsed = time.perf_counter() - started
+        try:
+            await asyncio.wait_for(consumer, timeout=max(30.0, webhook_elapsed * 5))
+        except asyncio.TimeoutError:
+            pass
+        total_elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return ScenarioResult(
+            scenario=scenario,
+            requests=total,
+            errors=errors,
+            elapsed=webhook_elapsed,
+            throughput=total / webhook_elapsed if webhook_elapsed else 0.0,
+            p50_ms=_percentile(latencies, 0.50) * 1000,
+            p99_ms=_percentile(latencies, 0.99) * 1000,
+            extra={"events_per_sec": total / total_elapsed if total_elapsed else 0.0},
+        )
+
+    async def run_stream(self, scenario: str) -> ScenarioResult:
+        total = self.args.requests
+        factory = PAYLOAD_FACTORIES[scenario]
+        base = self._next_mid
+        self._next_mid += total
+        published: Dict[str, float] = {}
+        latencies: List[float] = []
+        stats_before = self.adapter.get_event_stream_stats()
+
+        started = time.perf_counter()
+        consumer = asyncio.create_task(self._consume_events(total, scenario == "image", published, latencies))
+        for i in range(total):
+            payload = factory(base + i, self.args.user_pool)
+            published[str(payload["mid"])] = time.perf_counter()
+            await self.fake.publish_event(payload)
+            if self.args.stream_disconnect_every and (i + 1) % self.args.stream_disconnect_every == 0:
+                await self.fake.disconnect_streams()
+        publish_elapsed = time.perf_counter() - started
+        try:
+            await asyncio.wait_for(consumer, timeout=max(30.0, publish_elapsed * 5))
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+        stats_after = self.adapter.get_event_stream_stats()
+
+        latencies.sort()
+        return ScenarioResult(
+            scenario=f"stream_{scenario}",
+            requests=total,
+            errors=total - len(latencies),
+            elapsed=elapsed,
+            throughput=len(latencies) / elapsed if elapsed else 0.0,
+            p50_ms=_percentile(latencies, 0.50) * 1000,
+            p99_ms=_percentile(latencies, 0.99) * 1000,
+            extra={"reconnects": stats_after["reconnects"] - stats_before["reconnects"]},
+        )
+
+    async def run_send(self, scenario: str) -> ScenarioResult:
+        total, concurrency = self.args.requests, self.args.concurrency
+        image_path = os.path.join(self.tmpdir, "bench_send.png")
+        with open(image_path, "wb") as f:
+            f.write(os.urandom(self.args.file_size_kb * 1024))
+
+        def build_chain(i: int) -> MessageChain:
+            if scenario == "send_text":
+                return MessageChain([Plain(f"reply {i}")])
+            return MessageChain([Plain(f"reply {i} part 1"), Image.fromFileSystem(image_path), Plain("part 2")])
+
+        components_per_chain = 1 if scenario == "send_text" else 3
+        latencies: List[float] = []
+        sent_before = len(self.fake.sent_messages)
+        next_index = 0
+
+        async def sender() -> None:
+            nonlocal next_index
+            while next_index < total:
+                i = next_index
+                next_index += 1
+                session = MessageSesion(self.adapter.meta().id, MessageType.GROUP_MESSAGE, str(1 + i % self.args.targets))
+                started = time.perf_counter()
+                await self.adapter.send_by_session(session, build_chain(i))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        delivered = len(self.fake.sent_messages) - sent_before
+
+        latencies.sort()
+        return ScenarioResult(
+            scenario=scenario,
+            requests=total,
+            errors=total * components_per_chain - delivered,
+            elapsed=elapsed,
+            throughput=delivered / elapsed if elapsed else 0.0,
+            p50_ms=_percentile(latencies, 0.50) * 1000,
+            p99_ms=_percentile(latencies, 0.99) * 1000,
+            extra={"chains_per_sec": total / elapsed if elapsed else 0.0, "uploaded_bytes": self.fake.uploaded_bytes},
+        )
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="VoceChatAdapter 基准测试")
+    parser.add_argument("--scenario", default="all", help=f"逗号分隔，可选: {', '.join(WEBHOOK_SCENARIOS + SEND_SCENARIOS)}, all")
+    parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数 / 消息链数")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--user-pool", type=int, default=50, help="text/image 场景中的发送者数量")
+    parser.add_argument("--targets", type=int, default=20, help="发送场景中的目标频道数量")
+    parser.add_argument("--ingest-mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--receive-mode", choices=("webhook", "stream"), default="webhook", help="接收场景通过 Webhook 推送还是 SSE 事件流")
+    parser.add_argument("--stream-disconnect-every", type=int, default=0, help="stream 模式下每推送 N 条消息断开一次事件流，测试重连与续传")
+    parser.add_argument("--latency", type=float, default=0.005, help="模拟 VoceChat API 的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="在基础延迟上叠加的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 500 错误的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="注入 429 错误的比例")
+    parser.add_argument("--file-size-kb", type=int, default=256)
+    parser.add_argument("--send-rate", type=float, default=0, help="适配器发送限速（条/秒），0 表示不限速")
+    parser.add_argument("--no-upload-cache", action="store_true", help="关闭上传去重缓存")
+    parser.add_argument("--adapter-config", default="", help="以 JSON 覆盖适配器配置，例如 '{\"ingest_workers\": 8}'")
+    parser.add_argument("--log-level", default="WARNING", help="基准测试期间 AstrBot 日志级别，避免日志输出影响结果")
+    parser.add_argument("--json", dest="json_path", default="", help="将结果以 JSON 写入该文件")
+    return parser.parse_args(argv)
+
+
+def _print_results(results: List[ScenarioResult], peak_rss: Optional[float]) -> None:
+    print(f"{'scenario':<16} {'requests':>8} {'errors':>7} {'elapsed(s)':>10} {'throughput':>11} {'p50(ms)':>9} {'p99(ms)':>9}")
+    for r in results:
+        print(f"{r.scenario:<16} {r.requests:>8} {r.errors:>7} {r.elapsed:>10.2f} {r.throughput:>11.1f} {r.p50_ms:>9.2f} {r.p99_ms:>9.2f}  {r.extra}")
+    if peak_rss is not None:
+        print(f"peak RSS: {peak_rss:.1f} MB")
+
+
+async def main(argv: Optional[List[str]] = None) -> List[ScenarioResult]:
+    args = _parse_args(argv)
+    logger.setLevel(getattr(logging, args.log_level.upper(), logging.WARNING))
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    scenarios = WEBHOOK_SCENARIOS + SEND_SCENARIOS if args.scenario == "all" else tuple(s.strip() for s in args.scenario.split(","))
+    bench = AdapterBench(args)
+    await bench.setup()
+    results: List[ScenarioResult] = []
+    try:
+        for scenario in scenarios:
+            if scenario in WEBHOOK_SCENARIOS:
+                results.append(await bench.run_webhook(scenario))
+            elif scenario in SEND_SCENARIOS:
+                results.append(await bench.run_send(scenario))
+            else:
+                print(f"未知场景: {scenario}", file=sys.stderr)
+    finally:
+        await bench.teardown()
+
+    peak_rss = _peak_rss_mb()
+    _print_results(results, peak_rss)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"results": [asdict(r) for r in results], "peak_rss_mb": peak_rss, "args": vars(args)}, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
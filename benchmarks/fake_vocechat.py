@@ -0,0 +1,200 @@
+# benchmarks/fake_vocechat.py
+"""本地模拟的 VoceChat Bot API，用于基准测试。
+
+支持的接口：
+    GET  /api/bot/user/{uid}?uid=...
+    GET  /api/resource/file?file_path=...
+    POST /api/bot/send_to_user/{uid}
+    POST /api/bot/send_to_group/{gid}
+    PUT  /api/message/{mid}/edit
+    POST /api/bot/file/prepare
+    POST /api/bot/file/upload
+    GET  /api/user/events?after_mid=...   (SSE 事件流，通过 publish_event() 推送消息)
+
+可通过 latency / jitter 注入延迟，通过 error_rate / rate_limit_rate 注入 500 与 429 错误。
+"""
+import asyncio
+import bisect
+import itertools
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeVoceChatServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        file_size: int = 256 * 1024,
+        seed: Optional[int] = None,
+        heartbeat_interval: float = 15.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.file_size = file_size
+        self._random = random.Random(seed)
+        self._mid = itertools.count(1)
+        self._file_body = b"\x89PNG\r\n\x1a\n" + self._random.randbytes(max(0, file_size - 8))
+        self._runner: Optional[web.AppRunner] = None
+        self.heartbeat_interval = heartbeat_interval
+        self._events: List[bytes] = []  # 按 mid 递增排列的序列化事件
+        self._event_mids: List[int] = []
+        self._event_cond: Optional[asyncio.Condition] = None
+        self._stream_generation = 0
+
+        self.requests: Counter = Counter()
+        self.injected_errors: Counter = Counter()
+        self.sent_messages = []  # (路径, Content-Type, 请求体长度)
+        self.edited_messages = []  # (消息 mid, 编辑后的内容)
+        self.uploaded_bytes = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        # 适配器请求的是字面量 /api/bot/user/{uid}?uid=...，默认路由模式不匹配花括号
+        app.router.add_get("/api/bot/user/{tail:.*}", self._handle_user)
+        app.router.add_get("/api/resource/file", self._handle_file)
+        app.router.add_post("/api/bot/send_to_user/{uid}", self._handle_send)
+        app.router.add_post("/api/bot/send_to_group/{gid}", self._handle_send)
+        app.router.add_put("/api/message/{mid}/edit", self._handle_edit)
+        app.router.add_post("/api/bot/file/prepare", self._handle_prepare)
+        app.router.add_post("/api/bot/file/upload", self._handle_upload)
+        app.router.add_get("/api/user/events", self._handle_events)
+        self._event_cond = asyncio.Condition()
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        await self.disconnect_streams()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _inject(self, name: str) -> Optional[web.Response]:
+        """模拟延迟与错误，返回非 None 时直接作为响应"""
+        self.requests[name] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.injected_errors[f"{name}:429"] += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "0.1"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.injected_errors[f"{name}:500"] += 1
+            return web.Response(status=500, text="Injected Error")
+        return None
+
+    async def _handle_user(self, request: web.Request) -> web.Response:
+        injected = await self._inject("user")
+        if injected is not None:
+            return injected
+        uid = request.query.get("uid", "0")
+        return web.json_response({"uid": int(uid), "name": f"FakeUser{uid}"})
+
+    async def _handle_file(self, request: web.Request) -> web.StreamResponse:
+        injected = await self._inject("file")
+        if injected is not None:
+            return injected
+        return web.Response(body=self._file_body, content_type="image/png")
+
+    async def _handle_send(self, request: web.Request) -> web.Response:
+        injected = await self._inject("send")
+        if injected is not None:
+            return injected
+        body = await request.read()
+        self.sent_messages.append((request.path, request.headers.get("Content-Type", ""), len(body)))
+        return web.json_response(next(self._mid))
+
+    async def _handle_edit(self, request: web.Request) -> web.Response:
+        injected = await self._inject("edit")
+        if injected is not None:
+            return injected
+        self.edited_messages.append((int(request.match_info["mid"]), (await request.read()).decode("utf-8", errors="replace")))
+        return web.json_response(0)
+
+    async def _handle_prepare(self, request: web.Request) -> web.Response:
+        injected = await self._inject("prepare")
+        if injected is not None:
+            return injected
+        return web.json_response(str(uuid.uuid4()))
+
+    async def _handle_upload(self, request: web.Request) -> web.Response:
+        injected = await self._inject("upload")
+        if injected is not None:
+            return injected
+        form = await request.post()
+        chunk = form.get("chunk_data")
+        if chunk is not None and hasattr(chunk, "file"):
+            self.uploaded_bytes += len(chunk.file.read())
+        if form.get("chunk_is_last") == "true":
+            file_id = form.get("file_id", "")
+            return web.json_response({"path": f"fake/{file_id}", "size": self.uploaded_bytes, "hash": "", "image_properties": None})
+        return web.Response(text="")
+
+    async def publish_event(self, payload: Dict[str, Any]) -> None:
+        """向事件流推送一条聊天消息（payload 格式与 Webhook 相同，需包含递增的 mid）"""
+        mid = int(payload["mid"])
+        data = json.dumps({"type": "chat", **payload}).encode("utf-8")
+        async with self._event_cond:
+            self._events.append(data)
+            self._event_mids.append(mid)
+            self._event_cond.notify_all()
+
+    async def disconnect_streams(self) -> None:
+        """断开当前所有事件流连接，用于测试重连与续传"""
+        if self._event_cond is None:
+            return
+        async with self._event_cond:
+            self._stream_generation += 1
+            self._event_cond.notify_all()
+
+    async def _handle_events(self, request: web.Request) -> web.StreamResponse:
+        injected = await self._inject("events")
+        if injected is not None:
+            return injected
+        after_mid = int(request.query.get("after_mid") or 0)
+        generation = self._stream_generation
+        index = bisect.bisect_right(self._event_mids, after_mid)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await resp.prepare(request)
+        try:
+            while generation == self._stream_generation:
+                while index < len(self._events):
+                    await resp.write(b"data: " + self._events[index] + b"\n\n")
+                    index += 1
+                async with self._event_cond:
+                    try:
+                        await asyncio.wait_for(
+                            self._event_cond.wait_for(lambda: index < len(self._events) or generation != self._stream_generation),
+                            timeout=self.heartbeat_interval,
+                        )
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                heartbeat = json.dumps({"type": "heartbeat", "time": int(time.time() * 1000)}).encode("utf-8")
+                await resp.write(b"data: " + heartbeat + b"\n\n")
+        except ConnectionResetError:
+            pass
+        return resp
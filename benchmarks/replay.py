@@ -0,0 +1,286 @@
+# benchmarks/replay.py
+"""回放适配器以 record_path 记录的 Webhook 流量。
+
+需要在已安装 AstrBot 的环境中，于插件目录的上一级以模块方式运行，例如::
+
+    python -m astrbot_plugin_vocechat.benchmarks.replay traffic.jsonl traffic.jsonl.1 --speed 10
+
+按记录的时间间隔以 --speed 倍速（0 表示不等待，以 --concurrency 并发尽快发送）把数据 POST 到本地的
+VoceChatAdapter，适配器连接模拟的 VoceChat API。输出 Webhook 吞吐、响应延迟与从发送到事件提交的端到端延迟分布。
+使用 --reply 时为每个事件发送一条回复，同时测试发送路径。
+
+--snapshot 把转换得到的 AstrBotMessage 摘要写入 JSONL 文件；--compare 与之前保存的摘要逐条比较，
+报告缺失、多出与内容不同的消息，用于确认代码改动没有改变消息转换结果。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from astrbot import logger
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Image, Plain
+
+from .bench_adapter import AdapterBench, ScenarioResult, _parse_args as _parse_bench_args, _peak_rss_mb, _percentile, _print_results
+
+# 比较转换结果时使用的字段
+SUMMARY_FIELDS = ("type", "session_id", "sender_id", "sender_nickname", "message_str", "components")
+
+
+def load_records(paths: List[str]) -> List[Tuple[float, Dict[str, Any]]]:
+    """读取记录文件（可包含轮转出的旧文件），按接收时间排序"""
+    records: List[Tuple[float, Dict[str, Any]]] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    records.append((float(entry["ts"]), entry["payload"]))
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"跳过 {path}:{line_no}: {e}", file=sys.stderr)
+    records.sort(key=lambda r: r[0])
+    return records
+
+
+def summarize_message(message: Any) -> Dict[str, Any]:
+    message_type = getattr(message.type, "value", message.type)
+    return {
+        "message_id": str(message.message_id),
+        "type": str(message_type),
+        "session_id": str(message.session_id),
+        "sender_id": str(message.sender.user_id),
+        "sender_nickname": message.sender.nickname,
+        "message_str": message.message_str,
+        "components": [type(c).__name__ for c in message.message],
+    }
+
+
+def compare_summaries(baseline: List[Dict[str, Any]], current: List[Dict[str, Any]], max_examples: int = 5) -> Dict[str, Any]:
+    """按 message_id 比较两次回放的转换结果"""
+    before = {s["message_id"]: s for s in baseline}
+    after = {s["message_id"]: s for s in current}
+    missing = [mid for mid in before if mid not in after]
+    extra = [mid for mid in after if mid not in before]
+    changed = []
+    for mid, old in before.items():
+        new = after.get(mid)
+        if new is None:
+            continue
+        fields = [f for f in SUMMARY_FIELDS if old.get(f) != new.get(f)]
+        if fields:
+            changed.append({"message_id": mid, "fields": {f: [old.get(f), new.get(f)] for f in fields}})
+    return {
+        "missing": len(missing),
+        "extra": len(extra),
+        "changed": len(changed),
+        "examples": {"missing": missing[:max_examples], "extra": extra[:max_examples], "changed": changed[:max_examples]},
+    }
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {f"p{int(p * 100)}_ms": round(_percentile(values, p) * 1000, 3) for p in (0.5, 0.9, 0.99)} | {
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 3)
+    }
+
+
+class Replayer:
+    def __init__(self, args: argparse.Namespace, bench: AdapterBench) -> None:
+        self.args = args
+        self.bench = bench
+        self.sent_at: Dict[str, float] = {}
+        self.webhook_latencies: List[float] = []
+        self.e2e_latencies: List[float] = []
+        self.reply_latencies: List[float] = []
+        self.summaries: List[Dict[str, Any]] = []
+        self.errors = 0
+        self.max_lag = 0.0
+        self._last_event_at = 0.0
+        self._reply_tasks: List[asyncio.Task] = []
+
+    async def _post(self, session: aiohttp.ClientSession, payload: Dict[str, Any], semaphore: asyncio.Semaphore) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        mid = payload.get("mid")
+        started = time.perf_counter()
+        if mid is not None:
+            self.sent_at.setdefault(str(mid), started)
+        try:
+            async with session.post(self.bench.webhook_url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    self.errors += 1
+        except aiohttp.ClientError:
+            self.errors += 1
+        finally:
+            self.webhook_latencies.append(time.perf_counter() - started)
+            semaphore.release()
+
+    async def _reply(self, event: Any) -> None:
+        started = time.perf_counter()
+        await self.bench.adapter.send_by_session(event.session, MessageChain([Plain("r" * self.args.reply_chars)]))
+        self.reply_latencies.append(time.perf_counter() - started)
+
+    async def _consume(self, done: asyncio.Event) -> None:
+        queue = self.bench.event_queue
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=0.2)
+            except asyncio.TimeoutError:
+                # 全部发送完成且一段时间内没有新事件时结束
+                if done.is_set() and time.perf_counter() - self._last_event_at >= self.args.idle_timeout:
+                    return
+                continue
+            now = time.perf_counter()
+            self._last_event_at = now
+            message = event.message_obj
+            sent_at = self.sent_at.get(str(message.message_id))
+            if sent_at is not None:
+                self.e2e_latencies.append(now - sent_at)
+            self.summaries.append(summarize_message(message))
+            if self.args.materialize_images:
+                for component in message.message:
+                    if isinstance(component, Image):
+                        try:
+                            await component.convert_to_file_path()
+                        except Exception:
+                            pass
+            if self.args.reply:
+                self._reply_tasks.append(asyncio.create_task(self._reply(event)))
+
+    async def run(self, records: List[Tuple[float, Dict[str, Any]]]) -> ScenarioResult:
+        speed = self.args.speed
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        done = asyncio.Event()
+        consumer = asyncio.create_task(self._consume(done))
+        sent_before = len(self.bench.fake.sent_messages)
+        first_ts = records[0][0] if records else 0.0
+
+        started = time.perf_counter()
+        self._last_event_at = started
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            tasks = []
+            for ts, payload in records:
+                if speed > 0:
+                    due = (ts - first_ts) / speed
+                    delay = due - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        self.max_lag = max(self.max_lag, -delay)  # 适配器跟不上原始速率时的落后时间
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(self._post(session, payload, semaphore)))
+            await asyncio.gather(*tasks)
+        webhook_elapsed = time.perf_counter() - started
+        done.set()
+        await consumer
+        if self._reply_tasks:
+            await asyncio.gather(*self._reply_tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+        total = len(records)
+        self.webhook_latencies.sort()
+        dedupe = self.bench.adapter.get_dedupe_stats()
+        extra: Dict[str, Any] = {
+            "events": len(self.summaries),
+            "events_per_sec": round(len(self.summaries) / elapsed, 1) if elapsed else 0.0,
+            "duplicates": dedupe.get("duplicates", 0),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "webhook": _distribution(self.webhook_latencies),
+            "end_to_end": _distribution(self.e2e_latencies),
+        }
+        if self.args.reply:
+            extra["replies_delivered"] = len(self.bench.fake.sent_messages) - sent_before
+            extra["reply"] = _distribution(self.reply_latencies)
+        return ScenarioResult(
+            scenario=f"replay_x{speed:g}" if speed > 0 else "replay_max",
+            requests=total,
+            errors=self.errors,
+            elapsed=webhook_elapsed,
+            throughput=total / webhook_elapsed if webhook_elapsed else 0.0,
+            p50_ms=_percentile(self.webhook_latencies, 0.50) * 1000,
+            p99_ms=_percentile(self.webhook_latencies, 0.99) * 1000,
+            extra=extra,
+        )
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="回放记录的 VoceChat Webhook 流量")
+    parser.add_argument("files", nargs="+", help="record_path 记录的 JSONL 文件，可同时传入轮转出的旧文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，1 为原始速率，0 为不等待尽快发送")
+    parser.add_argument("--concurrency", type=int, default=100, help="同时进行的 Webhook 请求数上限")
+    parser.add_argument("--limit", type=int, default=0, help="只回放前 N 条，0 表示全部")
+    parser.add_argument("--ingest-mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--adapter-config", default="", help="以 JSON 覆盖适配器配置，例如 '{\"admission_enabled\": true}'")
+    parser.add_argument("--reply", action="store_true", help="为每个事件发送一条回复，测试发送路径")
+    parser.add_argument("--reply-chars", type=int, default=200, help="回复文本长度")
+    parser.add_argument("--materialize-images", action="store_true", help="模拟 LLM 流水线读取图片")
+    parser.add_argument("--idle-timeout", type=float, default=2.0, help="发送完成后多久没有新事件即结束（秒）")
+    parser.add_argument("--latency", type=float, default=0.005, help="模拟 VoceChat API 的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="在基础延迟上叠加的随机延迟上限（秒）")
+    parser.add_argument("--snapshot", default="", help="把转换结果摘要写入该 JSONL 文件")
+    parser.add_argument("--compare", default="", help="与该 JSONL 文件中的转换结果摘要比较")
+    parser.add_argument("--log-level", default="WARNING", help="回放期间 AstrBot 日志级别")
+    parser.add_argument("--json", dest="json_path", default="", help="将结果以 JSON 写入该文件")
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> ScenarioResult:
+    args = _parse_args(argv)
+    logger.setLevel(getattr(logging, args.log_level.upper(), logging.WARNING))
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    records = load_records(args.files)
+    if args.limit > 0:
+        records = records[: args.limit]
+    if not records:
+        raise SystemExit("没有可回放的记录")
+    span = records[-1][0] - records[0][0]
+    print(f"回放 {len(records)} 条记录，原始时长 {span:.1f} 秒，倍速 {args.speed:g}")
+
+    bench_args = _parse_bench_args([])
+    bench_args.ingest_mode = args.ingest_mode
+    bench_args.latency = args.latency
+    bench_args.jitter = args.jitter
+    bench_args.adapter_config = args.adapter_config
+    bench = AdapterBench(bench_args)
+    await bench.setup()
+    replayer = Replayer(args, bench)
+    try:
+        result = await replayer.run(records)
+    finally:
+        await bench.teardown()
+
+    _print_results([result], _peak_rss_mb())
+
+    if args.snapshot:
+        with open(args.snapshot, "w", encoding="utf-8") as f:
+            for summary in replayer.summaries:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        print(f"已将 {len(replayer.summaries)} 条转换结果写入 {args.snapshot}")
+    divergence = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        divergence = compare_summaries(baseline, replayer.summaries)
+        print(f"与 {args.compare} 比较: 缺失 {divergence['missing']}，多出 {divergence['extra']}，不同 {divergence['changed']}")
+        for kind, examples in divergence["examples"].items():
+            for example in examples:
+                print(f"  {kind}: {json.dumps(example, ensure_ascii=False)}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"result": asdict(result), "divergence": divergence, "args": vars(args)}, f, ensure_ascii=False, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,14 @@
 # my_vocechat_plugin/main.py
 
 from astrbot.api import logger
+from astrbot.api.event import AstrMessageEvent, filter
+from astrbot.api.provider import ProviderRequest
 from astrbot.api.star import Context, Star, register
 
 @register(
     name="vocechat_plugin_main",
     author="HikariFroya",
-    desc="VoceChat 平台适配器加载插件", 
+    desc="VoceChat 平台适配器加载插件",
     version="1.0.0"
 )
 class VoceChatPluginStar(Star):
@@ -15,3 +17,11 @@ class VoceChatPluginStar(Star):
 
         from .vocechat_adapter import VoceChatAdapter  # noqa: F401
         logger.info("VoceChatPluginStar (Star Component) 初始化成功。VoceChatAdapter 已被导入。")
+
+    @filter.on_llm_request()
+    async def replace_failed_images(self, event: AstrMessageEvent, request: ProviderRequest):
+        """下载失败的 VoceChat 图片不交给模型，改为文本标记"""
+        from .vocechat_attachment import strip_failed_images
+        count = strip_failed_images(event.message_obj.message, request)
+        if count:
+            logger.info(f"VoceChatPluginStar: {count} 张图片下载失败，已在 LLM 请求中替换为文本标记。")
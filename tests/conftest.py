@@ -0,0 +1,59 @@
+# tests/conftest.py
+"""以包的方式导入插件：插件目录本身没有 __init__.py，模块之间使用相对导入。
+
+需要已安装 AstrBot，在插件目录下运行 ``python -m pytest tests``；未安装时跳过全部测试。
+测试统一通过 ``vocechat_plugin.<模块名>`` 导入插件模块，不依赖插件目录的名称。
+"""
+import asyncio
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Optional
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 AstrBot 时会在 ASTRBOT_ROOT（默认为当前目录）下创建 data 目录
+os.environ.setdefault("ASTRBOT_ROOT", tempfile.mkdtemp(prefix="vocechat-test-"))
+
+try:
+    import astrbot.api  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+else:
+    # 以 vocechat_plugin 为名注册一个指向插件目录的包，子模块的相对导入都解析到这个名称下
+    _spec = importlib.machinery.ModuleSpec("vocechat_plugin", None, is_package=True)
+    _spec.submodule_search_locations = [PLUGIN_DIR]
+    sys.modules.setdefault("vocechat_plugin", importlib.util.module_from_spec(_spec))
+
+
+@pytest.fixture
+def make_adapter(tmp_path, monkeypatch):
+    """返回构造 VoceChatAdapter 的函数，事件队列为 adapter._event_queue，数据目录位于 tmp_path"""
+    monkeypatch.setenv("ASTRBOT_ROOT", str(tmp_path))
+    from vocechat_plugin.vocechat_adapter import VoceChatAdapter
+
+    def make(server_url: str = "http://127.0.0.1:9", **config):
+        platform_config = {"id": "vocechat_test", "vocechat_server_url": server_url, "api_key": "test", "get_user_nickname_from_api": False, **config}
+        return VoceChatAdapter(platform_config, {}, asyncio.Queue())
+
+    return make
+
+
+def _text_payload(mid: int, content: str = "hello", from_uid: int = 7, gid: Optional[int] = None, **detail) -> Dict[str, Any]:
+    return {
+        "mid": mid,
+        "from_uid": from_uid,
+        "created_at": 1700000000000 + mid,
+        "target": {"gid": gid} if gid is not None else {"uid": 1},
+        "detail": {"type": "normal", "content": content, "content_type": "text/plain", "properties": None, **detail},
+    }
+
+
+@pytest.fixture
+def text_payload():
+    """返回构造 VoceChat 文本消息 Webhook 数据 (dict) 的函数"""
+    return _text_payload
@@ -0,0 +1,66 @@
+# tests/test_vocechat_admission.py
+"""准入控制：回复发送完毕或事件被终止时立即释放会话的并发名额，不依赖垃圾回收。"""
+import asyncio
+import gc
+
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Plain
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+from vocechat_plugin.vocechat_payload import WebhookPayload
+
+
+async def _commit(adapter, payload):
+    await adapter._process_webhook_payload(payload)
+
+
+def _admission_adapter(make_adapter, server_url="http://127.0.0.1:9"):
+    return make_adapter(server_url, admission_enabled=True, admission_max_inflight_per_session=1)
+
+
+def test_stop_event_frees_the_slot(make_adapter, text_payload):
+    adapter = _admission_adapter(make_adapter)
+
+    async def scenario():
+        for mid in (1, 2, 3):
+            await _commit(adapter, WebhookPayload.from_dict(text_payload(mid)))
+        first = adapter._event_queue.get_nowait()
+        held = adapter.get_admission_stats()["held"]
+        gc.disable() # 持有事件引用且不做垃圾回收，名额也应当被释放
+        try:
+            first.stop_event()
+            first.stop_event() # 重复调用不会多释放
+            second = adapter._event_queue.get_nowait()
+            stats = adapter.get_admission_stats()
+        finally:
+            gc.enable()
+        return first, second, held, stats
+
+    first, second, held, stats = asyncio.run(scenario())
+    assert first.message_obj.message_id == "1" and second.message_obj.message_id == "2"
+    assert held == 2
+    assert (stats["held"], stats["inflight"]) == (1, 1)
+
+
+def test_send_frees_the_slot(make_adapter, text_payload):
+
+    async def scenario():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        adapter = _admission_adapter(make_adapter, server.base_url)
+        try:
+            for mid in (1, 2):
+                await _commit(adapter, WebhookPayload.from_dict(text_payload(mid)))
+            first = adapter._event_queue.get_nowait()
+            queued_before_send = adapter._event_queue.qsize()
+            await first.send(MessageChain([Plain("reply")]))
+            second = adapter._event_queue.get_nowait()
+            return first, second, queued_before_send, adapter.get_admission_stats()
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    first, second, queued_before_send, stats = asyncio.run(scenario())
+    assert queued_before_send == 0
+    assert second.message_obj.message_id == "2"
+    assert (stats["held"], stats["inflight"]) == (0, 1)
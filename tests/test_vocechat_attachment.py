@@ -0,0 +1,54 @@
+# tests/test_vocechat_attachment.py
+"""附件下载失败时不向流水线抛出异常，LLM 请求中以文本标记代替图片。"""
+import asyncio
+import contextlib
+
+from astrbot.api.message_components import Plain
+from astrbot.api.provider import ProviderRequest
+
+from vocechat_plugin import vocechat_attachment
+
+
+class _Response:
+    status = 404
+    content_length = None
+
+    async def text(self):
+        return "not found"
+
+
+@contextlib.asynccontextmanager
+async def _missing(file_path):
+    yield _Response()
+
+
+def _attachment(tmp_path, name="cat.png"):
+    store = vocechat_attachment.AttachmentStore(str(tmp_path), name="test")
+    return vocechat_attachment.VoceChatAttachment(store, "/f/1", name, "image/png", 10, _missing, url="http://vc/api/resource/file?file_path=/f/1")
+
+
+def test_failed_image_is_replaced_by_text_marker(tmp_path):
+    image = vocechat_attachment.VoceChatImage(_attachment(tmp_path))
+    file = vocechat_attachment.VoceChatFile(_attachment(tmp_path, "a.pdf"))
+
+    async def scenario():
+        return await image.convert_to_file_path(), await image.convert_to_base64(), await file.get_file(), await file.get_file(allow_return_url=True)
+
+    path, b64, file_path, file_url = asyncio.run(scenario())
+    assert (path, b64, file_path) == ("", "", "")
+    assert file_url == file.url
+    assert image.failed
+    assert not any(name.endswith(".png") for name in map(str, tmp_path.iterdir())) # 不生成占位图
+
+    request = ProviderRequest(prompt="看看这张图")
+    request.image_urls = [path]
+    count = vocechat_attachment.strip_failed_images([Plain("看看这张图"), image], request)
+    assert count == 1
+    assert request.image_urls == []
+    assert request.prompt == "看看这张图\n[图片下载失败: cat.png]"
+
+
+def test_strip_failed_images_ignores_successful_chains(tmp_path):
+    request = ProviderRequest(prompt="hi", image_urls=["/tmp/a.png"])
+    assert vocechat_attachment.strip_failed_images([Plain("hi")], request) == 0
+    assert request.image_urls == ["/tmp/a.png"] and request.prompt == "hi"
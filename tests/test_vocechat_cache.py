@@ -0,0 +1,29 @@
+# tests/test_vocechat_cache.py
+"""UserInfoCache 持久化文件损坏时应以空缓存启动，而不是让适配器启动失败。"""
+import json
+
+import pytest
+
+from vocechat_plugin import vocechat_cache
+
+
+@pytest.mark.parametrize("content", [
+    b'{"1": ["alice", 17000',                # 写入中途截断
+    b"\xff\xfe\x00garbage",                   # 编码错误
+    b'["alice", 1700000000]',                 # 顶层不是对象
+    b'{"1": ["alice", "soon"], "2": [1, 2]}', # 条目类型错误
+])
+def test_load_corrupt_file_starts_empty(tmp_path, content):
+    path = tmp_path / "users.json"
+    path.write_bytes(content)
+    cache = vocechat_cache.UserInfoCache(persist_path=str(path), name="test")
+    cache.load()
+    assert cache.get_stats()["size"] == 0
+
+
+def test_load_skips_invalid_entries(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps({"1": ["alice", 2.0], "2": ["bob", 1], "3": ["eve", None], "4": "carol"}), encoding="utf-8")
+    cache = vocechat_cache.UserInfoCache(persist_path=str(path), name="test")
+    cache.load()
+    assert list(cache._entries.items()) == [("2", ("bob", 1.0)), ("1", ("alice", 2.0))]
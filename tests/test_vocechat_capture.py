@@ -0,0 +1,73 @@
+# tests/test_vocechat_capture.py
+"""TrafficRecorder：按大小轮转并限制旧文件数、脱敏，以及轮转出的文件可以一起回放。"""
+import json
+import os
+
+from vocechat_plugin import vocechat_capture
+from vocechat_plugin.benchmarks.replay import load_records
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_rotation_keeps_at_most_backups_files(tmp_path, text_payload):
+    path = str(tmp_path / "capture" / "webhook.jsonl")
+    recorder = vocechat_capture.TrafficRecorder(path, max_bytes=600, backups=2, redact=False, name="test")
+    for mid in range(1, 31):
+        recorder.record(text_payload(mid), received_at=float(mid))
+    recorder.close()
+
+    files = sorted(os.listdir(tmp_path / "capture"))
+    assert files == ["webhook.jsonl", "webhook.jsonl.1", "webhook.jsonl.2"]
+    assert all(os.path.getsize(os.path.join(tmp_path, "capture", name)) <= 600 for name in files)
+    # 最新的记录在当前文件中，最早的随轮转被丢弃
+    assert _lines(path)[-1]["payload"]["mid"] == 30
+    kept = [entry["payload"]["mid"] for name in reversed(files) for entry in _lines(os.path.join(tmp_path, "capture", name))]
+    assert kept == list(range(31 - len(kept), 31))
+    stats = recorder.get_stats()
+    assert (stats["queued"], stats["recorded"], stats["dropped"], stats["errors"], stats["pending"]) == (30, 30, 0, 0, 0)
+
+
+def test_rotated_files_replay_in_order(tmp_path, text_payload):
+    path = str(tmp_path / "webhook.jsonl")
+    recorder = vocechat_capture.TrafficRecorder(path, max_bytes=600, backups=5, redact=False, name="test")
+    for mid in range(1, 11):
+        recorder.record(text_payload(mid), received_at=1000.0 + mid)
+    recorder.close()
+
+    paths = [str(p) for p in tmp_path.iterdir()]
+    assert len(paths) > 1
+    records = load_records(paths)
+    assert [payload["mid"] for _, payload in records] == list(range(1, 11))
+
+
+def test_zero_max_bytes_disables_rotation(tmp_path, text_payload):
+    path = str(tmp_path / "webhook.jsonl")
+    recorder = vocechat_capture.TrafficRecorder(path, max_bytes=0, backups=2, redact=False, name="test")
+    for mid in range(1, 21):
+        recorder.record(text_payload(mid))
+    recorder.close()
+    assert os.listdir(tmp_path) == ["webhook.jsonl"]
+    assert len(_lines(path)) == 20
+
+
+def test_redacted_records_keep_structure(tmp_path, text_payload):
+    path = str(tmp_path / "webhook.jsonl")
+    recorder = vocechat_capture.TrafficRecorder(path, name="test")
+    payload = text_payload(1, "/ask @15 secret words")
+    recorder.record(payload)
+    recorder.close()
+    (entry,) = _lines(path)
+    assert entry["payload"]["detail"]["content"] == "/ask @15 xxxxxx xxxxx"
+    assert entry["payload"]["mid"] == 1
+    assert payload["detail"]["content"] == "/ask @15 secret words" # 不修改原始数据
+
+
+def test_records_after_close_are_ignored(tmp_path, text_payload):
+    recorder = vocechat_capture.TrafficRecorder(str(tmp_path / "webhook.jsonl"), name="test")
+    recorder.close()
+    recorder.record(text_payload(1))
+    recorder.close()
+    assert recorder.get_stats()["queued"] == 0
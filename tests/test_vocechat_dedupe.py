@@ -0,0 +1,91 @@
+# tests/test_vocechat_dedupe.py
+"""去重键在处理成功后才生效：处理中的重投要求稍后重试，处理失败后的重投会被重新处理。"""
+import asyncio
+import json
+
+import pytest
+
+from vocechat_plugin import vocechat_payload
+
+
+def _payload(text_payload, mid: int = 1):
+    return vocechat_payload.decode_webhook(json.dumps(text_payload(mid)).encode("utf-8"))
+
+
+def _fail_first_attempt(adapter, monkeypatch, release: asyncio.Event = None):
+    original = adapter.convert_message
+    attempts = []
+
+    async def convert_message(data):
+        attempts.append(data.mid)
+        if len(attempts) == 1:
+            if release is not None:
+                await release.wait()
+            raise RuntimeError("首次处理失败")
+        return await original(data)
+
+    monkeypatch.setattr(adapter, "convert_message", convert_message)
+    return attempts
+
+
+def test_retry_after_failure_is_processed(make_adapter, text_payload, monkeypatch):
+    adapter = make_adapter(dedupe_enabled=True)
+    _fail_first_attempt(adapter, monkeypatch)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await adapter._ingest_payload(_payload(text_payload), b"")
+        retried = await adapter._ingest_payload(_payload(text_payload), b"")
+        duplicate = await adapter._ingest_payload(_payload(text_payload), b"")
+        return retried, duplicate
+
+    assert asyncio.run(scenario()) == ("ok", "duplicate")
+    assert adapter._event_queue.qsize() == 1
+
+
+def test_retry_while_in_progress_is_not_acknowledged(make_adapter, text_payload, monkeypatch):
+    adapter = make_adapter(dedupe_enabled=True)
+
+    async def scenario():
+        release = asyncio.Event()
+        _fail_first_attempt(adapter, monkeypatch, release)
+        first = asyncio.ensure_future(adapter._ingest_payload(_payload(text_payload), b""))
+        await asyncio.sleep(0)
+        concurrent = await adapter._ingest_payload(_payload(text_payload), b"")
+        release.set()
+        with pytest.raises(RuntimeError):
+            await first
+        retried = await adapter._ingest_payload(_payload(text_payload), b"")
+        return concurrent, retried
+
+    assert asyncio.run(scenario()) == ("in_progress", "ok")
+    assert adapter._event_queue.qsize() == 1
+
+
+def test_async_worker_failure_allows_retry(make_adapter, text_payload, monkeypatch):
+    adapter = make_adapter(dedupe_enabled=True, ingest_mode="async")
+    _fail_first_attempt(adapter, monkeypatch)
+
+    async def scenario():
+        adapter._ingest_pool.start()
+        outcomes = [await adapter._ingest_payload(_payload(text_payload), b"")]
+        await asyncio.sleep(0.05) # worker 处理失败
+        outcomes.append(await adapter._ingest_payload(_payload(text_payload), b""))
+        await asyncio.sleep(0.05)
+        outcomes.append(await adapter._ingest_payload(_payload(text_payload), b""))
+        await adapter._ingest_pool.stop()
+        return outcomes
+
+    assert asyncio.run(scenario()) == ["ok", "ok", "duplicate"]
+    assert adapter._event_queue.qsize() == 1
+    assert adapter.get_dedupe_stats()["in_progress"] == 0
+
+
+def test_dedupe_is_off_by_default(make_adapter, text_payload):
+    adapter = make_adapter()
+
+    async def scenario():
+        return [await adapter._ingest_payload(_payload(text_payload), b"") for _ in range(2)]
+
+    assert asyncio.run(scenario()) == ["ok", "ok"]
+    assert adapter.get_dedupe_stats() == {"enabled": False}
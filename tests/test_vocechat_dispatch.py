@@ -0,0 +1,64 @@
+# tests/test_vocechat_dispatch.py
+"""OutboundDispatcher 的重试范围与 worker 空闲退出。"""
+import asyncio
+
+import aiohttp
+import pytest
+
+from vocechat_plugin import vocechat_dispatch
+
+
+def _dispatcher(**kwargs) -> "vocechat_dispatch.OutboundDispatcher":
+    return vocechat_dispatch.OutboundDispatcher(global_rate=0, per_target_rate=0, backoff_base=0, backoff_max=0, name="test", **kwargs)
+
+
+@pytest.mark.parametrize("error, expected_calls", [
+    (vocechat_dispatch.RetryableSendError("503", status=503), 3),
+    pytest.param(getattr(aiohttp, "ConnectionTimeoutError", Exception)(), 3, marks=pytest.mark.skipif(not hasattr(aiohttp, "ConnectionTimeoutError"), reason="aiohttp 版本过旧")),
+    (asyncio.TimeoutError(), 1), # 读取超时：服务器可能已收到消息
+    (ConnectionResetError(), 1),
+])
+def test_retry_only_before_send(error, expected_calls):
+    dispatcher = _dispatcher(max_retries=2)
+    calls = 0
+
+    async def send_once():
+        nonlocal calls
+        calls += 1
+        raise error
+
+    with pytest.raises(type(error)):
+        asyncio.run(dispatcher.call_with_retry("u:1", send_once))
+    assert calls == expected_calls
+
+
+def test_worker_keeps_jobs_across_idle_timeouts():
+    async def scenario():
+        dispatcher = _dispatcher(idle_timeout=0.01)
+        results = []
+        for i in range(20):
+            results.append(await dispatcher.submit("u:1", lambda i=i: asyncio.sleep(0, result=i)))
+            await asyncio.sleep(0.01 if i % 2 else 0)
+        await asyncio.sleep(0.05)
+        assert dispatcher.get_stats()["active_targets"] == 0 # 空闲后释放 worker
+        await dispatcher.stop()
+        return results
+
+    assert asyncio.run(scenario()) == list(range(20))
+
+
+def test_idle_target_buckets_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(vocechat_dispatch.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        dispatcher = vocechat_dispatch.OutboundDispatcher(global_rate=0, per_target_rate=5, per_target_burst=10, idle_timeout=30, name="test")
+        # 待投递消息与编辑直接调用 throttle()，不经过目标 worker
+        for i in range(100):
+            await dispatcher.throttle(f"u:{i}")
+        assert dispatcher.get_stats()["target_buckets"] == 100
+        now[0] += 31
+        await dispatcher.throttle("u:new")
+        return dispatcher.get_stats()["target_buckets"]
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,57 @@
+# tests/test_vocechat_event.py
+"""通过真实的 AstrMessageEvent.__init__ 构造 VoceChatEvent，确认适配器的追踪不会与 AstrBot 自带的 trace 属性冲突，且合并消息的追踪都能结束。"""
+import asyncio
+import json
+
+import pytest
+
+from vocechat_plugin import vocechat_payload, vocechat_trace
+
+
+async def _commit_one(adapter, payload: dict):
+    payload = vocechat_payload.decode_webhook(json.dumps(payload).encode("utf-8"))
+    if adapter._recorder is not None:
+        payload.trace = adapter._recorder.start() # 与 _handle_webhook_request 相同，在入口处开始追踪
+    await adapter._ingest_payload(payload, b"")
+    return adapter._event_queue.get_nowait()
+
+
+@pytest.mark.parametrize("sample_rate", [0, 1])
+def test_commit_event_through_astrbot_init(make_adapter, text_payload, sample_rate):
+    event = asyncio.run(_commit_one(make_adapter(trace_sample_rate=sample_rate), text_payload(1)))
+
+    assert event.get_message_str() == "hello"
+    assert event.get_sender_name() is not None
+    # AstrBot 的 TraceSpan 保持不变，适配器的追踪放在 _vc_trace
+    assert not isinstance(event.trace, vocechat_trace.Trace)
+    if sample_rate:
+        assert isinstance(event._vc_trace, vocechat_trace.Trace)
+        assert [name for name, _ in event._vc_trace.marks][-1] == "commit"
+        assert event._vc_trace.duration is None
+        event.stop_event() # 不依赖垃圾回收，事件被终止时结束追踪
+        assert event._vc_trace.duration is not None and event._vc_trace.marks[-1][0] == "done"
+    else:
+        assert event._vc_trace is None
+
+
+def test_merged_messages_finish_their_traces(make_adapter, text_payload):
+    adapter = make_adapter(trace_sample_rate=1, debounce_window_ms=10000)
+
+    async def scenario():
+        traces = []
+        for mid, content in ((1, "a"), (2, "b"), (3, "c")):
+            payload = vocechat_payload.decode_webhook(json.dumps(text_payload(mid, content)).encode("utf-8"))
+            payload.trace = adapter._recorder.start()
+            traces.append(payload.trace)
+            await adapter._ingest_payload(payload, b"")
+        adapter._aggregator.flush_all()
+        return adapter._event_queue.get_nowait(), traces
+
+    event, traces = asyncio.run(scenario())
+    assert event.get_message_str() == "a\nb\nc"
+    # 被并入的两条消息以 merged 结束，合并结果的追踪记录其来源
+    for trace in traces[:2]:
+        assert trace.duration is not None and trace.marks[-1][0] == "merged"
+    assert event._vc_trace is traces[2]
+    assert traces[2].attrs["merged"] == [traces[0].trace_id, traces[1].trace_id]
+    assert adapter._recorder.get_stats()["finished"] >= 2
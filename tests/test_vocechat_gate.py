@@ -0,0 +1,111 @@
+# tests/test_vocechat_gate.py
+"""Webhook 在解析前的拒绝路径（来源、密钥、类型、大小）与无效请求体的日志。"""
+import asyncio
+import json
+import logging
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from vocechat_plugin import vocechat_gate
+
+
+def _post(make_adapter, requests, **config):
+    """把 requests 中的 (路径, 请求参数) 依次发给适配器的 Webhook 处理函数，返回 (状态码列表, 适配器)"""
+    adapter = make_adapter(**config)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/hook", adapter._handle_webhook_request)
+        async with TestClient(TestServer(app)) as client:
+            statuses = []
+            for path, kwargs in requests:
+                async with client.post(path, **kwargs) as resp:
+                    statuses.append(resp.status)
+            return statuses
+
+    return asyncio.run(scenario()), adapter
+
+
+def _json(payload):
+    return {"data": json.dumps(payload), "headers": {"Content-Type": "application/json"}}
+
+
+@pytest.mark.parametrize("config, path, extra_headers, status, reason", [
+    ({"webhook_allow_ips": ["10.0.0.0/8"]}, "/hook", {}, 403, "forbidden_ip"),
+    ({"webhook_secret": "s3"}, "/hook", {}, 403, "bad_secret"),
+    ({"webhook_secret": "s3"}, "/hook", {"X-VoceChat-Secret": "wrong"}, 403, "bad_secret"),
+    ({"webhook_secret": "s3"}, "/hook", {"X-VoceChat-Secret": "s3"}, 200, None),
+    ({"webhook_secret": "s3"}, "/hook?secret=s3", {}, 200, None),
+    ({"webhook_allow_ips": ["127.0.0.0/8"]}, "/hook", {}, 200, None),
+])
+def test_source_checks(make_adapter, text_payload, config, path, extra_headers, status, reason):
+    kwargs = _json(text_payload(1))
+    kwargs["headers"].update(extra_headers)
+    statuses, adapter = _post(make_adapter, [(path, kwargs)], **config)
+    assert statuses == [status]
+    rejected = adapter.get_webhook_gate_stats()["rejected"]
+    assert sum(rejected.values()) == (0 if reason is None else 1)
+    if reason is not None:
+        assert rejected[reason] == 1
+        assert adapter._event_queue.empty()
+
+
+def test_content_type_and_size_checks(make_adapter, text_payload):
+    big = json.dumps(text_payload(1, "x" * 4096))
+
+    async def chunked():
+        yield big.encode()
+
+    statuses, adapter = _post(make_adapter, [
+        ("/hook", {"data": json.dumps(text_payload(1)), "headers": {"Content-Type": "text/plain"}}),
+        ("/hook", {"data": big, "headers": {"Content-Type": "application/json"}}), # 声明的 Content-Length 超限
+        ("/hook", {"data": chunked(), "headers": {"Content-Type": "application/json"}}), # 未声明长度，读取时超限
+        ("/hook", {"data": json.dumps(text_payload(2)).encode(), "skip_auto_headers": ["Content-Type"]}), # 未声明 Content-Type 时放行
+    ], webhook_max_body_kb=1)
+    assert statuses == [415, 413, 413, 200]
+    rejected = adapter.get_webhook_gate_stats()["rejected"]
+    assert (rejected["content_type"], rejected["too_large"]) == (1, 2)
+    assert 'vocechat_webhook_rejected_total{instance="vocechat_test",reason="too_large"} 2' in adapter._metrics.render()
+
+
+def test_invalid_payload_is_logged_without_body(make_adapter, caplog):
+    body = '{"mid": 1, "detail": "private words'
+    with caplog.at_level(logging.WARNING):
+        statuses, adapter = _post(make_adapter, [("/hook", {"data": body, "headers": {"Content-Type": "application/json"}})] * 3)
+    assert statuses == [400, 400, 400]
+    assert adapter.get_webhook_gate_stats()["rejected"]["invalid_payload"] == 3
+    messages = [r.getMessage() for r in caplog.records if "invalid_payload" in r.getMessage()]
+    assert len(messages) == 1 # 同一原因在 log_interval 内只记录一条
+    assert f"{len(body.encode())} 字节" in messages[0]
+    assert "private words" not in caplog.text
+
+
+def test_suppressed_rejections_are_reported_with_next_log(monkeypatch, caplog):
+    now = [1000.0]
+    monkeypatch.setattr(vocechat_gate.time, "monotonic", lambda: now[0])
+    gate = vocechat_gate.WebhookGate(log_interval=10, name="test")
+
+    class _Request:
+        remote = "203.0.113.9"
+
+    with caplog.at_level(logging.WARNING):
+        for _ in range(4):
+            gate.reject("bad_secret", _Request())
+        now[0] += 11
+        gate.reject("bad_secret", _Request())
+        gate.reject("forbidden_ip", _Request()) # 不同原因分别限流
+
+    messages = [r.getMessage() for r in caplog.records if "WebhookGate 'test'" in r.getMessage()]
+    assert len(messages) == 3
+    assert "另有 3 条同类请求未记录" in messages[1]
+    assert "forbidden_ip" in messages[2]
+    assert gate.get_stats()["rejected"]["bad_secret"] == 5
+
+
+def test_invalid_allow_ips_entries_are_ignored(caplog):
+    with caplog.at_level(logging.WARNING):
+        gate = vocechat_gate.WebhookGate(allow_ips=["10.0.0.0/8", "not-an-ip", ""], name="test")
+    assert gate.get_stats()["allow_ips"] == ["10.0.0.0/8"]
+    assert "not-an-ip" in caplog.text
@@ -0,0 +1,100 @@
+# tests/test_vocechat_history.py
+"""回复引用在本地消息记录中解析：用户消息、机器人自己发出的消息、未命中与容量上限。"""
+import asyncio
+
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Plain, Reply
+from astrbot.api.platform import MessageType
+from astrbot.core.platform.astr_message_event import MessageSesion
+
+from vocechat_plugin import vocechat_history
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+
+def _reply_to(text_payload, mid: int, reply_mid: int, **kwargs):
+    payload = text_payload(mid, "re", **kwargs)
+    payload["detail"].update(type="reply", mid=reply_mid)
+    return payload
+
+
+def test_reply_is_resolved_from_history(make_adapter, text_payload):
+    adapter = make_adapter()
+
+    async def scenario():
+        await adapter.convert_message(text_payload(1, "original", gid=5))
+        resolved = await adapter.convert_message(_reply_to(text_payload, 2, 1, from_uid=8, gid=5))
+        other_session = await adapter.convert_message(_reply_to(text_payload, 3, 1, gid=6))
+        nested = await adapter.convert_message(_reply_to(text_payload, 4, 2, gid=5))
+        return resolved, other_session, nested
+
+    resolved, other_session, nested = asyncio.run(scenario())
+    reply = resolved.message[0]
+    assert isinstance(reply, Reply)
+    assert (reply.id, str(reply.sender_id), reply.message_str) == ("1", "7", "original")
+    assert [c.text for c in reply.chain] == ["original"]
+    assert resolved.message_str == "re"
+
+    miss = other_session.message[0] # 只在同一会话中查找
+    assert isinstance(miss, Reply) and miss.id == "1" and not miss.chain
+
+    assert not any(isinstance(c, Reply) for c in nested.message[0].chain) # 不嵌套引用
+    stats = adapter.get_history_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_reply_to_bot_message_uses_sent_mid(make_adapter, text_payload):
+    async def scenario():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        adapter = make_adapter(server.base_url, default_bot_self_uid="1")
+        try:
+            session = MessageSesion(adapter.meta().id, MessageType.GROUP_MESSAGE, "5")
+            await adapter.send_by_session(session, MessageChain([Plain("bot says hi")]))
+            sent_mid = adapter._history.get("5", "1") is not None
+            abm = await adapter.convert_message(_reply_to(text_payload, 10, 1, gid=5))
+            return sent_mid, abm
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    sent_mid, abm = asyncio.run(scenario())
+    assert sent_mid # FakeVoceChatServer 返回的第一个 mid 为 1
+    reply = abm.message[0]
+    assert (reply.id, str(reply.sender_id), reply.message_str) == ("1", "1", "bot says hi")
+
+
+def test_history_disabled(make_adapter, text_payload):
+    adapter = make_adapter(history_max_per_session=0)
+    abm = asyncio.run(adapter.convert_message(_reply_to(text_payload, 2, 1)))
+    assert not any(isinstance(c, Reply) for c in abm.message)
+    assert adapter.get_history_stats() == {"enabled": False}
+
+
+def _entry(mid: str) -> vocechat_history.HistoryEntry:
+    return vocechat_history.HistoryEntry(mid, "7", "", 0, mid, [])
+
+
+def test_per_session_and_total_limits():
+    history = vocechat_history.MessageHistory(max_per_session=3, max_total=5)
+    for i in range(4):
+        history.add("a", _entry(f"a{i}"))
+    assert history.get("a", "a0") is None # 超过单会话上限，淘汰最早的
+    assert [history.get("a", f"a{i}") is not None for i in range(1, 4)] == [True] * 3
+
+    for i in range(3):
+        history.add("b", _entry(f"b{i}"))
+    assert len(history) == 5
+    assert history.get("a", "a1") is None # 超过总上限，按全局插入顺序淘汰
+    assert history.get("b", "b0") is not None
+
+    history.add("b", _entry(""))  # 没有 mid 的消息不记录
+    stats = history.get_stats()
+    assert (stats["sessions"], stats["entries"], stats["evictions"]) == (2, 5, 2)
+
+
+def test_empty_sessions_are_removed():
+    history = vocechat_history.MessageHistory(max_per_session=10, max_total=2)
+    history.add("a", _entry("1"))
+    history.add("b", _entry("2"))
+    history.add("c", _entry("3"))
+    assert history.get_stats()["sessions"] == 2
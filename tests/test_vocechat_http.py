@@ -0,0 +1,58 @@
+# tests/test_vocechat_http.py
+"""适配器 HTTP 客户端的连接池配置、连接复用与按操作类别的超时。"""
+import asyncio
+import time
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+
+def test_pool_and_timeouts_follow_config(make_adapter):
+    adapter = make_adapter(http_pool_limit=7, http_pool_limit_per_host=3, http_timeout_lookup=2, http_timeout_download=50)
+
+    async def scenario():
+        session = await adapter._get_http_session()
+        same = await adapter._get_http_session()
+        stats = adapter.get_http_pool_stats()
+        await session.close()
+        return session is same, stats
+
+    reused, stats = asyncio.run(scenario())
+    assert reused
+    assert stats["limit"] == 7 and stats["limit_per_host"] == 3
+    assert adapter._timeout("lookup").total == 2
+    assert adapter._timeout("download").total == 50 and adapter._timeout("download").sock_read == 30
+    assert adapter._timeout("send").total == 10
+
+
+def test_sequential_requests_reuse_one_connection(make_adapter):
+    async def scenario():
+        server = FakeVoceChatServer()
+        await server.start()
+        adapter = make_adapter(server.base_url, get_user_nickname_from_api=True)
+        try:
+            names = [await adapter._request_user_nickname(str(uid)) for uid in range(1, 6)]
+            return names, adapter.get_http_pool_stats()
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    names, stats = asyncio.run(scenario())
+    assert names == [f"FakeUser{uid}" for uid in range(1, 6)]
+    assert stats["active"] == 0 and stats["idle"] == 1
+
+
+def test_lookup_timeout_bounds_a_slow_server(make_adapter):
+    async def scenario():
+        server = FakeVoceChatServer(latency=2.0)
+        await server.start()
+        adapter = make_adapter(server.base_url, get_user_nickname_from_api=True, http_timeout_lookup=0.2)
+        started = time.monotonic()
+        try:
+            return await adapter._request_user_nickname("1"), time.monotonic() - started
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    name, elapsed = asyncio.run(scenario())
+    assert name is None
+    assert elapsed < 1.5
@@ -0,0 +1,144 @@
+# tests/test_vocechat_image.py
+"""ImagePreprocessor：缩放、重新压缩、按 file_path 缓存，以及无需处理或无法解码时回退到原图。"""
+import asyncio
+import base64
+import contextlib
+import os
+import random
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image as PILImage  # noqa: E402
+
+from vocechat_plugin import vocechat_attachment, vocechat_image  # noqa: E402
+
+
+def _photo(path, size=(1200, 800)):
+    """生成带噪点的图片，PNG 体积明显大于缩放后的 JPEG"""
+    rnd = random.Random(1)
+    im = PILImage.frombytes("RGB", size, rnd.randbytes(size[0] * size[1] * 3))
+    im.save(path, format="PNG")
+    return str(path)
+
+
+def _preprocessor(tmp_path, **kwargs):
+    store = vocechat_attachment.AttachmentStore(str(tmp_path / "cache"), name="test")
+    return vocechat_image.ImagePreprocessor(store, name="test", **{"max_edge": 256, "max_workers": 1, **kwargs})
+
+
+def _run(preprocessor, scenario):
+    async def wrapped():
+        try:
+            return await scenario()
+        finally:
+            preprocessor.shutdown()
+
+    return asyncio.run(wrapped())
+
+
+def test_large_image_is_downscaled_and_cached(tmp_path):
+    source = _photo(tmp_path / "photo.png")
+    preprocessor = _preprocessor(tmp_path)
+
+    async def scenario():
+        first = await preprocessor.process(source, "/f/photo", "photo.png")
+        second = await preprocessor.process(source, "/f/photo", "photo.png")
+        return first, second
+
+    first, second = _run(preprocessor, scenario)
+    assert first != source and first == second
+    assert first.endswith(".jpg") and os.path.dirname(first) == preprocessor.store.cache_dir
+    with PILImage.open(first) as im:
+        assert im.format == "JPEG" and max(im.size) == 256
+    stats = preprocessor.get_stats()
+    assert stats["processed"] == 1 and stats["cache_hits"] == 1
+    assert stats["bytes_in"] == os.path.getsize(source)
+    assert stats["bytes_out"] == os.path.getsize(first)
+    assert stats["bytes_saved"] > 0
+
+
+def test_transform_parameters_are_part_of_cache_key(tmp_path):
+    source = _photo(tmp_path / "photo.png")
+    jpeg = _preprocessor(tmp_path)
+    webp = _preprocessor(tmp_path, output_format="webp")
+
+    async def scenario():
+        return await jpeg.process(source, "/f/photo"), await webp.process(source, "/f/photo")
+
+    try:
+        jpeg_path, webp_path = _run(jpeg, scenario)
+    finally:
+        webp.shutdown()
+    assert jpeg_path.endswith(".jpg") and webp_path.endswith(".webp")
+    assert webp.get_stats()["cache_hits"] == 0
+
+
+def test_image_that_would_grow_is_passed_through(tmp_path):
+    source = tmp_path / "dot.png"
+    PILImage.new("RGB", (8, 8), (255, 0, 0)).save(source, format="PNG")
+    preprocessor = _preprocessor(tmp_path)
+
+    async def scenario():
+        return await preprocessor.process(str(source), "/f/dot"), await preprocessor.process(str(source), "/f/dot")
+
+    assert _run(preprocessor, scenario) == (str(source), str(source))
+    stats = preprocessor.get_stats()
+    assert stats["passthrough"] == 1 and stats["processed"] == 0  # 第二次不再提交给进程池
+    assert os.listdir(preprocessor.store.cache_dir) == []
+
+
+def test_animated_image_is_passed_through(tmp_path):
+    source = tmp_path / "anim.gif"
+    frames = [PILImage.new("RGB", (600, 600), color) for color in ((255, 0, 0), (0, 0, 255))]
+    frames[0].save(source, format="GIF", save_all=True, append_images=frames[1:])
+    preprocessor = _preprocessor(tmp_path)
+
+    assert _run(preprocessor, lambda: preprocessor.process(str(source), "/f/anim")) == str(source)
+    assert preprocessor.get_stats()["passthrough"] == 1
+
+
+def test_undecodable_image_falls_back_to_original(tmp_path):
+    source = tmp_path / "broken.png"
+    source.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100)
+    preprocessor = _preprocessor(tmp_path)
+
+    assert _run(preprocessor, lambda: preprocessor.process(str(source), "/f/broken")) == str(source)
+    assert preprocessor.get_stats()["failures"] == 1
+
+
+class _Content:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+
+class _Response:
+    status = 200
+
+    def __init__(self, body):
+        self.content_length = len(body)
+        self.content = _Content(body)
+
+
+def test_lazy_image_hands_preprocessed_copy_to_llm(tmp_path):
+    body = open(_photo(tmp_path / "photo.png"), "rb").read()
+
+    @contextlib.asynccontextmanager
+    async def opener(file_path):
+        yield _Response(body)
+
+    preprocessor = _preprocessor(tmp_path)
+    attachment = vocechat_attachment.VoceChatAttachment(preprocessor.store, "/f/photo", "photo.png", "image/png", len(body), opener, preprocessor=preprocessor)
+    image = vocechat_attachment.VoceChatImage(attachment)
+
+    async def scenario():
+        return await image.convert_to_file_path(), await image.convert_to_base64(), await attachment.get_path()
+
+    path, b64, original = _run(preprocessor, scenario)
+    assert path != original
+    assert base64.b64decode(b64) == open(path, "rb").read()
+    assert open(original, "rb").read() == body
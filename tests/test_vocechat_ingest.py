@@ -0,0 +1,87 @@
+# tests/test_vocechat_ingest.py
+"""WebhookIngestPool 的会话内顺序、会话间隔离与溢出策略。"""
+import asyncio
+
+from vocechat_plugin import vocechat_ingest
+
+
+def test_slow_session_does_not_stall_other_sessions():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(item):
+            session, index = item
+            if session == "slow":
+                await release.wait()
+            handled.append(item)
+
+        # 慢会话只占用一个 worker，其他会话由另一个 worker 处理
+        pool = vocechat_ingest.WebhookIngestPool(handler, worker_count=2, queue_size=100, name="test")
+        pool.start()
+        await pool.submit("slow", ("slow", 0))
+        await pool.submit("slow", ("slow", 1))
+        for i in range(10):
+            await pool.submit(f"u{3 + i % 3}", (f"u{3 + i % 3}", i))
+        await asyncio.sleep(0.05)
+        fast_done = list(handled)
+        release.set()
+        await pool.stop()
+        return fast_done, handled
+
+    fast_done, handled = asyncio.run(scenario())
+    assert len(fast_done) == 10
+    assert [item for item in handled if item[0] == "slow"] == [("slow", 0), ("slow", 1)]
+    for session in ("u3", "u4", "u5"):
+        indexes = [index for name, index in handled if name == session]
+        assert indexes == sorted(indexes)
+
+
+def test_session_is_processed_by_one_worker_at_a_time():
+    async def scenario():
+        running = set()
+        overlaps = 0
+        order = []
+
+        async def handler(item):
+            nonlocal overlaps
+            session, index = item
+            if session in running:
+                overlaps += 1
+            running.add(session)
+            await asyncio.sleep(0.001)
+            running.discard(session)
+            order.append(index)
+
+        pool = vocechat_ingest.WebhookIngestPool(handler, worker_count=8, queue_size=100, name="test")
+        pool.start()
+        for i in range(30):
+            await pool.submit("one", ("one", i))
+        await pool.stop()
+        return overlaps, order
+
+    overlaps, order = asyncio.run(scenario())
+    assert overlaps == 0
+    assert order == list(range(30))
+
+
+def test_overflow_policies():
+    async def scenario(policy):
+        release = asyncio.Event()
+
+        async def handler(item):
+            await release.wait()
+
+        pool = vocechat_ingest.WebhookIngestPool(handler, worker_count=1, queue_size=2, overflow_policy=policy, put_timeout=0.05, name="test")
+        pool.start()
+        accepted = [await pool.submit("a", i) for i in range(3)]
+        asyncio.get_running_loop().call_later(0.01, release.set)
+        # block 策略下等待 worker 腾出空位
+        late = await pool.submit("b", 3) if policy == "block" else None
+        await pool.stop()
+        return accepted, late, pool.get_stats()
+
+    accepted, late, stats = asyncio.run(scenario("reject"))
+    assert accepted == [True, True, False] and stats["overflowed"] == 1
+    accepted, late, stats = asyncio.run(scenario("block"))
+    assert accepted == [True, True, False] and late is True
@@ -0,0 +1,41 @@
+# tests/test_vocechat_metrics.py
+"""指标与追踪路由与 Webhook 共用端口，只对白名单来源（及持有 webhook_secret 的请求）开放。"""
+import asyncio
+from unittest import mock
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+
+def _request(path: str, remote: str, headers=None):
+    transport = mock.Mock()
+    transport.get_extra_info.side_effect = lambda name, default=None: (remote, 40000) if name == "peername" else default
+    return make_mocked_request("GET", path, headers=headers or {}, transport=transport)
+
+
+@pytest.mark.parametrize("config, path, remote, expected", [
+    ({}, "/metrics", "127.0.0.1", 200),
+    ({}, "/metrics", "203.0.113.9", 403), # 默认只允许本机
+    ({"metrics_allow_ips": ["10.0.0.0/8"]}, "/metrics", "10.1.2.3", 200),
+    ({"metrics_allow_ips": []}, "/metrics", "203.0.113.9", 200),
+    ({"webhook_secret": "s3"}, "/metrics", "127.0.0.1", 403),
+    ({"webhook_secret": "s3"}, "/metrics?secret=s3", "127.0.0.1", 200),
+])
+def test_metrics_route_is_gated(make_adapter, config, path, remote, expected):
+    adapter = make_adapter(metrics_enabled=True, **config)
+    response = asyncio.run(adapter._handle_metrics_request(_request(path, remote)))
+    assert response.status == expected
+    if expected == 200:
+        assert "vocechat_webhook_requests" in response.text
+
+
+@pytest.mark.parametrize("config, path, remote, expected", [
+    ({}, "/debug/traces", "127.0.0.1", 200),
+    ({}, "/debug/traces", "203.0.113.9", 403),
+    ({"webhook_secret": "s3"}, "/debug/traces?format=jsonl", "127.0.0.1", 403),
+    ({"webhook_secret": "s3"}, "/debug/traces?format=jsonl&secret=s3", "127.0.0.1", 200),
+])
+def test_trace_route_is_gated(make_adapter, config, path, remote, expected):
+    adapter = make_adapter(trace_sample_rate=1, **config)
+    response = asyncio.run(adapter._handle_trace_request(_request(path, remote)))
+    assert response.status == expected
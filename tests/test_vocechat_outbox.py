@@ -0,0 +1,154 @@
+# tests/test_vocechat_outbox.py
+"""SendOutbox：同一目标内按入队顺序投递、失败退避时不越过前面的消息，以及重启后继续投递。"""
+import asyncio
+
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Plain
+from astrbot.api.platform import MessageType
+from astrbot.core.platform.astr_message_event import MessageSesion
+
+from vocechat_plugin import vocechat_outbox
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+
+def _row(text: str):
+    return ("message", "text/plain", text.encode("utf-8"), "")
+
+
+class _Recorder:
+    """记录投递顺序，fail 中的消息在剩余次数内抛出异常"""
+
+    def __init__(self, fail=None):
+        self.delivered = []
+        self.fail = dict(fail or {})
+
+    async def __call__(self, item):
+        text = item.body.decode("utf-8")
+        if self.fail.get(text, 0) > 0:
+            self.fail[text] -= 1
+            raise ConnectionError("server down")
+        self.delivered.append(text)
+
+
+def _outbox(path, deliver, **kwargs):
+    return vocechat_outbox.SendOutbox(str(path), deliver, **{"backoff_base": 60.0, "name": "test", **kwargs})
+
+
+def test_failed_item_blocks_only_its_own_target(tmp_path):
+    deliver = _Recorder(fail={"a1": 1})
+    outbox = _outbox(tmp_path / "outbox.db", deliver)
+
+    async def scenario():
+        await outbox.enqueue("/user/1", "1", [_row("a1"), _row("a2")])
+        await outbox.enqueue("/group/2", "2", [_row("b1")])
+        await outbox.flush_once()
+        after_failure = list(deliver.delivered)
+        await outbox.flush_once() # a1 仍在退避，a2 不能越过它
+        while_backing_off = list(deliver.delivered)
+        await outbox.flush_once(ignore_backoff=True)
+        stats = outbox.get_stats()
+        await outbox.stop(drain_timeout=1)
+        return after_failure, while_backing_off, stats
+
+    after_failure, while_backing_off, stats = asyncio.run(scenario())
+    assert after_failure == ["b1"]
+    assert while_backing_off == ["b1"]
+    assert deliver.delivered == ["b1", "a1", "a2"]
+    assert (stats["depth"], stats["delivered"], stats["retries"]) == (0, 3, 1)
+
+
+def test_undelivered_items_are_replayed_after_restart(tmp_path):
+    path = tmp_path / "outbox.db"
+    down = _Recorder(fail={text: 100 for text in ("m1", "m2", "m3")})
+    up = _Recorder()
+
+    async def before_restart():
+        outbox = _outbox(path, down)
+        outbox.start()
+        await outbox.enqueue("/user/1", "1", [_row("m1"), _row("m2")])
+        await outbox.enqueue("/user/1", "1", [_row("m3")])
+        await outbox.stop(drain_timeout=0.5)
+        return outbox.get_stats()
+
+    async def after_restart():
+        outbox = _outbox(path, up)
+        outbox.start()
+        depth_on_start = outbox.queue_depth()
+        await outbox.flush_once(ignore_backoff=True)
+        await outbox.stop(drain_timeout=1)
+        return depth_on_start, outbox.get_stats()
+
+    stopped = asyncio.run(before_restart())
+    assert stopped["depth"] == 3 and stopped["delivered"] == 0
+    depth_on_start, stats = asyncio.run(after_restart())
+    assert depth_on_start == 3
+    assert up.delivered == ["m1", "m2", "m3"]
+    assert stats["depth"] == 0 and stats["oldest_age"] == 0.0
+
+
+def test_items_are_dropped_after_max_attempts_or_permanent_error(tmp_path):
+    async def deliver(item):
+        if item.body == b"gone":
+            raise vocechat_outbox.OutboxPermanentError("file removed")
+        raise ConnectionError("server down")
+
+    outbox = _outbox(tmp_path / "outbox.db", deliver, max_attempts=2)
+
+    async def scenario():
+        await outbox.enqueue("/user/1", "1", [_row("x")])
+        await outbox.enqueue("/user/2", "2", [("upload_path", "image/png", b"gone", "a.png")])
+        await outbox.flush_once()
+        await outbox.flush_once(ignore_backoff=True)
+        stats = outbox.get_stats()
+        await outbox.stop(drain_timeout=0)
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats["depth"], stats["dropped_attempts"], stats["dropped_failed"], stats["retries"]) == (0, 1, 1, 1)
+
+
+def test_expired_items_are_dropped(tmp_path):
+    outbox = _outbox(tmp_path / "outbox.db", _Recorder(), max_age=0.01)
+
+    async def scenario():
+        await outbox.enqueue("/user/1", "1", [_row("late")])
+        await asyncio.sleep(0.05)
+        await outbox.flush_once()
+        stats = outbox.get_stats()
+        await outbox.stop(drain_timeout=0)
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert (stats["depth"], stats["dropped_expired"], stats["delivered"]) == (0, 1, 0)
+
+
+def test_adapter_send_survives_outage_and_restart(make_adapter, tmp_path):
+    path = str(tmp_path / "outbox.db")
+    config = dict(outbox_enabled=True, outbox_path=path, outbox_drain_timeout=0.5, send_max_retries=0)
+
+    async def scenario():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        try:
+            server.error_rate = 1.0
+            adapter = make_adapter(server.base_url, **config)
+            session = MessageSesion(adapter.meta().id, MessageType.GROUP_MESSAGE, "5")
+            await adapter.send_by_session(session, MessageChain([Plain("one"), Plain("two")])) # 写入发件箱即返回
+            queued = adapter.get_outbox_stats()["depth"]
+            await adapter.shutdown_server_resources()
+
+            server.error_rate = 0.0
+            adapter = make_adapter(server.base_url, **config)
+            adapter._outbox.start()
+            for _ in range(200):
+                if adapter.get_outbox_stats()["depth"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            await adapter.shutdown_server_resources()
+            return queued, server.sent_messages
+        finally:
+            await server.stop()
+
+    queued, sent = asyncio.run(scenario())
+    assert queued == 2
+    assert [(p, n) for p, _, n in sent] == [("/api/bot/send_to_group/5", 3), ("/api/bot/send_to_group/5", 3)]
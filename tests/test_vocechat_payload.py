@@ -0,0 +1,72 @@
+# tests/test_vocechat_payload.py
+"""Webhook 数据解码：各类消息的字段、去重键、错误结构，以及未安装 orjson 时回退到标准库 json。"""
+import importlib.util
+import json
+import sys
+
+import pytest
+
+from vocechat_plugin import vocechat_payload
+
+
+def _decode(data) -> "vocechat_payload.WebhookPayload":
+    return vocechat_payload.decode_webhook(json.dumps(data).encode("utf-8"))
+
+
+def test_text_message(text_payload):
+    payload = _decode(text_payload(42, "你好", gid=5))
+    assert (payload.mid, payload.from_uid, payload.target.gid, payload.target.uid) == ("42", "7", "5", None)
+    assert payload.detail.content == "你好" and payload.detail.content_type == "text/plain"
+    assert payload.session_key == "group:5"
+    assert payload.dedupe_key == "mid:42"
+    assert _decode(text_payload(43)).session_key == "user:7"
+
+
+@pytest.mark.parametrize("properties", [
+    {"files": [{"name": "a.png", "content_type": "image/png", "size": 10, "path": "/p/a"}]},
+    {"name": "a.png", "content_type": "image/png", "size": 10},
+])
+def test_file_message(text_payload, properties):
+    data = text_payload(1, "/p/a" if "files" not in properties else "", content_type="vocechat/file", properties=properties)
+    file = _decode(data).detail.file
+    assert (file.path, file.name, file.content_type, file.size) == ("/p/a", "a.png", "image/png", 10)
+
+
+def test_reply_mid(text_payload):
+    reply = text_payload(2, "re")
+    reply["detail"].update(type="reply", mid=1)
+    assert _decode(reply).detail.reply_mid == "1"
+    assert _decode(text_payload(3, "re", properties={"reply_mid": 9})).detail.reply_mid == "9"
+    assert _decode(text_payload(4)).detail.reply_mid == ""
+
+
+def test_new_user_event_without_mid():
+    payload = _decode({"from_uid": 0, "created_at": 123, "target": {"gid": 3}, "detail": {"content": "newuser", "properties": {"user": {"uid": 8, "name": "bob"}}}})
+    assert payload.detail.is_new_user_event
+    assert (payload.detail.new_user_uid, payload.detail.new_user_name) == ("8", "bob")
+    assert payload.dedupe_key == "newuser:3:8:123"
+
+
+@pytest.mark.parametrize("body", [
+    b"{not json",
+    b"\xff\xfe",
+    b"[]",
+    b'{"target": "x"}',
+    b'{"target": {}, "detail": [1]}',
+])
+def test_invalid_payloads_raise_payload_error(body):
+    with pytest.raises(vocechat_payload.PayloadError):
+        vocechat_payload.decode_webhook(body)
+
+
+def test_stdlib_json_fallback(monkeypatch, text_payload):
+    monkeypatch.setitem(sys.modules, "orjson", None) # import orjson 抛出 ImportError
+    spec = importlib.util.spec_from_file_location("vocechat_payload_stdlib", vocechat_payload.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    assert module._loads is not vocechat_payload._loads
+    payload = module.decode_webhook(json.dumps(text_payload(1, "hi")).encode("utf-8"))
+    assert payload.detail.content == "hi"
+    with pytest.raises(module.PayloadError):
+        module.decode_webhook(b"{")
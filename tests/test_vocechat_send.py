@@ -0,0 +1,110 @@
+# tests/test_vocechat_send.py
+"""消息链的组件并发准备（编码、上传），但发送请求严格按组件顺序发出；同一目标的消息链不会交错。"""
+import asyncio
+import time
+
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Image, Plain
+from astrbot.api.platform import MessageType
+from astrbot.core.platform.astr_message_event import MessageSesion
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+
+def _slow_prepare(adapter, delays):
+    """按文本长度查找延迟，模拟耗时不同的上传：越靠前的组件准备得越慢"""
+    prepare = adapter._prepare_component
+
+    async def slow(component, target_id_str, comp_desc):
+        await asyncio.sleep(delays.get(len(getattr(component, "text", "")), 0))
+        return await prepare(component, target_id_str, comp_desc)
+
+    adapter._prepare_component = slow
+
+
+def _run(make_adapter, scenario, **config):
+    async def wrapped():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        adapter = make_adapter(server.base_url, **config)
+        try:
+            result = await scenario(adapter)
+            return result, [length for _, _, length in server.sent_messages], server
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    return asyncio.run(wrapped())
+
+
+def _session(adapter, target="5"):
+    return MessageSesion(adapter.meta().id, MessageType.GROUP_MESSAGE, target)
+
+
+def test_components_are_sent_in_order_while_prepared_concurrently(make_adapter):
+    chain = MessageChain([Plain("a" * n) for n in (1, 2, 3, 4)])
+
+    async def scenario(adapter):
+        _slow_prepare(adapter, {1: 0.3, 2: 0.2, 3: 0.1, 4: 0.0})
+        started = time.perf_counter()
+        await adapter.send_by_session(_session(adapter), chain)
+        return time.perf_counter() - started
+
+    elapsed, sent, _ = _run(make_adapter, scenario, send_prepare_concurrency=4)
+    assert sent == [1, 2, 3, 4]
+    assert elapsed < 0.5 # 接近最慢的一次准备 (0.3s)，而不是总和 (0.6s)
+
+
+def test_sequential_prepare_keeps_order(make_adapter):
+    chain = MessageChain([Plain("a" * n) for n in (1, 2, 3)])
+
+    async def scenario(adapter):
+        _slow_prepare(adapter, {1: 0.05, 2: 0.0, 3: 0.02})
+        await adapter.send_by_session(_session(adapter), chain)
+
+    _, sent, _ = _run(make_adapter, scenario, send_prepare_concurrency=1)
+    assert sent == [1, 2, 3]
+
+
+def test_failed_component_is_skipped(make_adapter, tmp_path):
+    chain = MessageChain([Plain("a"), Image(file=str(tmp_path / "missing.png")), Plain("abc")])
+
+    async def scenario(adapter):
+        _slow_prepare(adapter, {1: 0.1})
+        await adapter.send_by_session(_session(adapter), chain)
+
+    _, sent, server = _run(make_adapter, scenario, send_prepare_concurrency=4)
+    assert sent == [1, 3]
+    assert server.requests["prepare"] == 0
+
+
+def test_chains_to_one_target_do_not_interleave(make_adapter):
+    first = MessageChain([Plain("a" * n) for n in (1, 2)])
+    second = MessageChain([Plain("a" * n) for n in (3, 4)])
+    other = MessageChain([Plain("a" * 5)])
+
+    async def scenario(adapter):
+        _slow_prepare(adapter, {1: 0.2, 2: 0.2})
+        await asyncio.gather(
+            adapter.send_by_session(_session(adapter), first),
+            adapter.send_by_session(_session(adapter), second),
+            adapter.send_by_session(_session(adapter, "6"), other), # 其他目标不必等待
+        )
+
+    _, sent, server = _run(make_adapter, scenario, send_prepare_concurrency=4)
+    group5 = [length for (path, _, length) in server.sent_messages if path.endswith("/5")]
+    assert group5 == [1, 2, 3, 4]
+    assert sent[0] == 5
+
+
+def test_uploads_and_text_keep_chain_order(make_adapter, tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 1000)
+    chain = MessageChain([Image(file=str(image)), Plain("caption")])
+
+    async def scenario(adapter):
+        await adapter.send_by_session(_session(adapter), chain)
+
+    _, _, server = _run(make_adapter, scenario, send_prepare_concurrency=4)
+    assert server.requests["upload"] >= 1
+    assert [content_type for _, content_type, _ in server.sent_messages] == ["vocechat/file", "text/plain"]
@@ -0,0 +1,38 @@
+# tests/test_vocechat_stream.py
+"""事件流模式：跳过机器人自己发送的消息，但续传位置照常前进。"""
+import asyncio
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+
+async def _wait_for(predicate, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.01)
+
+
+def test_own_messages_are_not_committed(make_adapter, text_payload):
+    async def scenario():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        adapter = make_adapter(server.base_url, receive_mode="stream", default_bot_self_uid="1")
+        task = asyncio.create_task(adapter.run())
+        try:
+            await _wait_for(lambda: adapter.get_event_stream_stats()["connected"])
+            await server.publish_event(text_payload(1, content="bot reply", from_uid=1))
+            await server.publish_event(text_payload(2, content="from user", from_uid=7))
+            event = await asyncio.wait_for(adapter._event_queue.get(), 5)
+            await asyncio.sleep(0.1)
+            return event, adapter._event_queue.qsize(), adapter.get_event_stream_stats()
+        finally:
+            adapter._stop_event.set()
+            await asyncio.wait_for(task, 5)
+            await server.stop()
+
+    event, remaining, stats = asyncio.run(scenario())
+    assert event.message_obj.message_id == "2"
+    assert event.message_obj.sender.user_id == "7"
+    assert remaining == 0
+    assert stats["events"] == 2
+    assert stats["last_event_id"] == "2"
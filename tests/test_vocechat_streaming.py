@@ -0,0 +1,78 @@
+# tests/test_vocechat_streaming.py
+"""流式输出：默认一次发送；开启编辑后编辑同一条消息；404 只影响当前消息；实时分段按句子分条发送。"""
+import asyncio
+
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Plain
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+from vocechat_plugin.vocechat_payload import WebhookPayload
+
+
+async def _chunks(*texts):
+    for text in texts:
+        yield MessageChain([Plain(text)])
+        await asyncio.sleep(0)
+
+
+def _run(make_adapter, text_payload, scenario, **config):
+    async def wrapped():
+        server = FakeVoceChatServer(seed=1)
+        await server.start()
+        adapter = make_adapter(server.base_url, stream_edit_interval=0, **config)
+        try:
+            await adapter._process_webhook_payload(WebhookPayload.from_dict(text_payload(1)))
+            event = adapter._event_queue.get_nowait()
+            await scenario(event)
+            return adapter.get_streaming_stats(), server
+        finally:
+            await adapter.shutdown_server_resources()
+            await server.stop()
+
+    return asyncio.run(wrapped())
+
+
+def test_edit_is_off_by_default(make_adapter, text_payload):
+    stats, server = _run(make_adapter, text_payload, lambda event: event.send_streaming(_chunks("Hel", "lo")))
+    assert len(server.sent_messages) == 1
+    assert server.requests["edit"] == 0
+    assert stats["edit_supported"] is False
+
+
+def test_stream_edits_one_message(make_adapter, text_payload):
+    stats, server = _run(make_adapter, text_payload, lambda event: event.send_streaming(_chunks("Hel", "lo", " world")), stream_edit_enabled=True)
+    assert len(server.sent_messages) == 1
+    assert server.edited_messages[-1] == (1, "Hello world")
+    assert stats["edit_supported"] is True and stats["fallbacks"] == 0
+
+
+def test_missing_message_only_affects_that_stream(make_adapter, text_payload):
+    async def scenario(event):
+        await event.send_streaming(_chunks("a", "b"))
+        await event.send_streaming(_chunks("c", "d"))
+
+    stats, server = _run(make_adapter, text_payload, scenario, stream_edit_enabled=True, stream_edit_path="/api/message/{mid}/missing")
+    assert stats["edit_supported"] is None # 404 不会让之后的流式输出停用编辑
+    assert stats["fallbacks"] == 2
+    assert len(server.sent_messages) == 4 # 每条流式消息: 首段 + 结束后补发的剩余部分
+
+
+def test_unsupported_edit_disables_editing(make_adapter, text_payload):
+    async def scenario(event):
+        await event.send_streaming(_chunks("a", "b"))
+        await event.send_streaming(_chunks("c", "d"))
+
+    stats, server = _run(make_adapter, text_payload, scenario, stream_edit_enabled=True, stream_edit_path="/api/bot/send_to_user/{mid}") # PUT 返回 405
+    assert stats["edit_supported"] is False
+    assert stats["fallbacks"] == 1
+    assert len(server.sent_messages) == 3 # 第二条流式消息直接一次发送
+
+
+def test_use_fallback_sends_each_sentence(make_adapter, text_payload):
+    stats, server = _run(
+        make_adapter, text_payload,
+        lambda event: event.send_streaming(_chunks("第一句。第", "二句！", "尾巴"), use_fallback=True),
+        stream_edit_enabled=True,
+    )
+    assert [length for _, _, length in server.sent_messages] == [len(t.encode("utf-8")) for t in ("第一句。", "第二句！", "尾巴")]
+    assert server.requests["edit"] == 0
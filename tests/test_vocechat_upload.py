@@ -0,0 +1,83 @@
+# tests/test_vocechat_upload.py
+"""uploadFile2VoceChat / uploadBytes2VoceChat 的分块上传与按内容哈希复用。"""
+import asyncio
+import base64
+import json
+
+from astrbot.api.message_components import Image
+
+from vocechat_plugin.benchmarks.fake_vocechat import FakeVoceChatServer
+
+CHUNK = 64 * 1024
+
+
+async def _with_server(make_adapter, scenario, **config):
+    server = FakeVoceChatServer(seed=1)
+    await server.start()
+    adapter = make_adapter(server.base_url, upload_chunk_size_kb=CHUNK // 1024, **config)
+    try:
+        return await scenario(adapter, server)
+    finally:
+        await adapter.shutdown_server_resources()
+        await server.stop()
+
+
+def test_file_is_uploaded_in_chunks(make_adapter, tmp_path):
+    path = tmp_path / "big.bin"
+    path.write_bytes(b"x" * (3 * CHUNK + 123))
+
+    async def scenario(adapter, server):
+        result = await adapter.uploadFile2VoceChat(str(path), "big.bin", "application/octet-stream")
+        return result, server
+
+    result, server = asyncio.run(_with_server(make_adapter, scenario, upload_cache_ttl=0))
+    assert json.loads(result)["path"].startswith("fake/")
+    assert server.requests["prepare"] == 1
+    assert server.requests["upload"] == 4
+    assert server.uploaded_bytes == 3 * CHUNK + 123
+
+
+def test_same_content_is_uploaded_once(make_adapter, tmp_path):
+    first, second = tmp_path / "a.png", tmp_path / "b.png"
+    first.write_bytes(b"png" * 1000)
+    second.write_bytes(b"png" * 1000)
+
+    async def scenario(adapter, server):
+        results = await asyncio.gather(*(adapter.uploadFile2VoceChat(str(first), "a.png", "image/png") for _ in range(5)))
+        results.append(await adapter.uploadFile2VoceChat(str(second), "a.png", "image/png")) # 内容相同的另一个文件
+        results.append(await adapter.uploadBytes2VoceChat(b"png" * 1000, "a.png", "image/png")) # 与文件共用缓存
+        prepared = server.requests["prepare"]
+        await adapter.uploadFile2VoceChat(str(first), "renamed.png", "image/png") # 文件名不同时重新上传
+        return results, prepared, server.requests["prepare"]
+
+    results, prepared, prepared_after_rename = asyncio.run(_with_server(make_adapter, scenario))
+    assert len(set(results)) == 1 and results[0] is not None
+    assert prepared == 1
+    assert prepared_after_rename == 2
+
+
+def test_failed_upload_is_not_cached(make_adapter):
+    async def scenario(adapter, server):
+        server.error_rate = 1.0
+        failed = await adapter.uploadBytes2VoceChat(b"data", "a.txt", "text/plain")
+        server.error_rate = 0.0
+        retried = await adapter.uploadBytes2VoceChat(b"data", "a.txt", "text/plain")
+        return failed, retried
+
+    failed, retried = asyncio.run(_with_server(make_adapter, scenario))
+    assert failed is None
+    assert retried is not None
+
+
+def test_base64_image_is_decoded_for_upload(make_adapter):
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+    adapter = make_adapter()
+
+    async def scenario():
+        row = await adapter._serialize_component(Image.fromBase64(base64.b64encode(png).decode()), "user 1", "Image")
+        broken = await adapter._serialize_component(Image(file="base64://abc"), "user 1", "Image")
+        return row, broken
+
+    row, broken = asyncio.run(scenario())
+    assert row == ("upload", "image/png", png, "image.png")
+    assert broken is None # 填充错误
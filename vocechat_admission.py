@@ -0,0 +1,208 @@
+# vocechat_admission.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from astrbot import logger
+
+# 优先级，数值越小越优先
+PRIORITY_COMMAND = 0   # 以 "/" 开头的指令
+PRIORITY_PRIVATE = 1   # 私聊（以及新用户加入等事件）
+PRIORITY_MENTION = 2   # 群聊中 @ 机器人或回复机器人的消息
+PRIORITY_CHATTER = 3   # 普通群聊消息，积压时可以丢弃
+PRIORITY_NAMES = ("command", "private", "mention", "chatter")
+
+SHED_POLICIES = ("drop_oldest", "drop_new")
+
+
+class _Held:
+    __slots__ = ("event", "key", "is_group", "priority")
+
+    def __init__(self, event: Any, key: str, is_group: bool, priority: int) -> None:
+        self.event = event
+        self.key = key
+        self.is_group = is_group
+        self.priority = priority
+
+
+class AdmissionController:
+    """在事件提交到 AstrBot 事件队列之前做准入控制与优先级调度。
+
+    每个私聊会话 / 群最多同时有 max_inflight_per_session / max_inflight_per_group 个事件在 AstrBot 中处理
+    （0 表示不限制），超出的事件暂存，前面的事件处理完后按优先级依次提交。事件通过 add_done_callback 通知处理完成
+    （VoceChatEvent 在回复发送完毕或事件被终止时调用），超过 inflight_timeout 秒仍未完成的也不再计入。
+
+    AstrBot 事件队列深度达到 queue_threshold 时，普通群聊消息暂缓提交，其余优先级不受影响；
+    暂缓的普通群聊消息超过 shed_buffer 条时按 shed_policy 丢弃最早的 (drop_oldest) 或新到的 (drop_new) 消息。
+    """
+
+    def __init__(
+        self,
+        commit: Callable[[Any], None],
+        queue_depth: Callable[[], int],
+        max_inflight_per_session: int = 0,
+        max_inflight_per_group: int = 0,
+        queue_threshold: int = 100,
+        shed_policy: str = "drop_oldest",
+        shed_buffer: int = 50,
+        max_held: int = 1000,
+        inflight_timeout: float = 300.0,
+        poll_interval: float = 0.05,
+        name: str = "",
+    ) -> None:
+        self._commit = commit
+        self._queue_depth = queue_depth
+        self.max_inflight_per_session = max(0, int(max_inflight_per_session))
+        self.max_inflight_per_group = max(0, int(max_inflight_per_group))
+        self.queue_threshold = max(1, int(queue_threshold))
+        if shed_policy not in SHED_POLICIES:
+            logger.warning(f"AdmissionController '{name}': 不支持的丢弃策略 '{shed_policy}'，使用 'drop_oldest'。")
+            shed_policy = "drop_oldest"
+        self.shed_policy = shed_policy
+        self.shed_buffer = max(0, int(shed_buffer))
+        self.max_held = max(1, int(max_held))
+        self.inflight_timeout = float(inflight_timeout)
+        self.poll_interval = max(0.01, float(poll_interval))
+        self.name = name
+
+        self._held: List[Deque[_Held]] = [deque() for _ in PRIORITY_NAMES]
+        self._held_count = 0
+        self._inflight: Dict[int, Tuple[str, float]] = {}  # token -> (会话 key, 提交时间)
+        self._inflight_by_key: Dict[str, int] = {}
+        self._next_token = 0
+        self._poll_timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.admitted = [0] * len(PRIORITY_NAMES)
+        self.shed = [0] * len(PRIORITY_NAMES)
+        self.delayed = [0] * len(PRIORITY_NAMES)  # 曾被暂存的事件数
+        self.inflight_timeouts = 0
+        self._last_shed_log = 0.0
+
+    def add(self, event: Any, priority: int, key: str, is_group: bool) -> None:
+        """提交一个事件：条件允许时立即进入 AstrBot 事件队列，否则暂存或丢弃"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        held = _Held(event, key, is_group, priority)
+        # 同一会话同一优先级已有暂存的事件时排在其后，保证顺序
+        if not any(h.key == key for h in self._held[priority]) and self._can_admit(held):
+            self._admit(held)
+            return
+
+        if priority == PRIORITY_CHATTER and len(self._held[priority]) >= self.shed_buffer:
+            if self.shed_policy == "drop_new" or not self._held[priority]:
+                self._shed(held, "drop_new")
+                return
+            self._shed(self._held[priority].popleft(), "drop_oldest")
+            self._held_count -= 1
+        elif self._held_count >= self.max_held:
+            self._shed(held, "overflow")
+            return
+        self._held[priority].append(held)
+        self._held_count += 1
+        self.delayed[priority] += 1
+        self._schedule_poll()
+
+    def _can_admit(self, held: _Held) -> bool:
+        limit = self.max_inflight_per_group if held.is_group else self.max_inflight_per_session
+        if limit and self._inflight_by_key.get(held.key, 0) >= limit:
+            return False
+        if held.priority == PRIORITY_CHATTER and self._queue_depth() >= self.queue_threshold:
+            return False
+        return True
+
+    def _admit(self, held: _Held) -> None:
+        token = self._next_token
+        self._next_token += 1
+        self._inflight[token] = (held.key, time.monotonic())
+        self._inflight_by_key[held.key] = self._inflight_by_key.get(held.key, 0) + 1
+        self.admitted[held.priority] += 1
+        self._commit(held.event)
+        held.event.add_done_callback(lambda _event: self._release_and_pump(token))
+
+    def _shed(self, held: _Held, reason: str) -> None:
+        self.shed[held.priority] += 1
+        now = time.monotonic()
+        if now - self._last_shed_log >= 10.0:  # 限制日志频率
+            self._last_shed_log = now
+            logger.warning(
+                f"AdmissionController '{self.name}': 暂存的事件已满 (暂存 {self._held_count}, 事件队列深度 {self._queue_depth()})，"
+                f"丢弃 {PRIORITY_NAMES[held.priority]} 消息 ({reason}, 会话 {held.key})，累计丢弃 {sum(self.shed)} 条。"
+            )
+
+    def _release(self, token: int) -> None:
+        entry = self._inflight.pop(token, None)
+        if entry is None:
+            return
+        key = entry[0]
+        remaining = self._inflight_by_key.get(key, 0) - 1
+        if remaining > 0:
+            self._inflight_by_key[key] = remaining
+        else:
+            self._inflight_by_key.pop(key, None)
+
+    def _release_and_pump(self, token: int) -> None:
+        self._release(token)
+        if self._held_count:
+            self._pump()
+
+    def _expire_inflight(self) -> None:
+        if self.inflight_timeout <= 0 or not self._inflight:
+            return
+        deadline = time.monotonic() - self.inflight_timeout
+        for token in [t for t, (_, admitted_at) in self._inflight.items() if admitted_at < deadline]:
+            self._release(token)
+            self.inflight_timeouts += 1
+
+    def _pump(self) -> None:
+        """按优先级提交暂存的事件，同一会话内保持到达顺序"""
+        self._expire_inflight()
+        for queue in self._held:
+            if not queue:
+                continue
+            blocked_keys = set()
+            remaining: Deque[_Held] = deque()
+            while queue:
+                held = queue.popleft()
+                if held.key not in blocked_keys and self._can_admit(held):
+                    self._held_count -= 1
+                    self._admit(held)
+                else:
+                    blocked_keys.add(held.key)
+                    remaining.append(held)
+            queue.extend(remaining)
+        if self._held_count:
+            self._schedule_poll()
+
+    def _schedule_poll(self) -> None:
+        # 事件队列深度的变化没有通知，暂存期间定期检查
+        if self._poll_timer is None:
+            self._poll_timer = self._loop.call_later(self.poll_interval, self._on_poll)
+
+    def _on_poll(self) -> None:
+        self._poll_timer = None
+        self._pump()
+
+    def flush_all(self) -> None:
+        """不再做准入检查，按优先级提交全部暂存的事件"""
+        if self._poll_timer is not None:
+            self._poll_timer.cancel()
+            self._poll_timer = None
+        for queue in self._held:
+            while queue:
+                self._held_count -= 1
+                self._admit(queue.popleft())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue_depth(),
+            "queue_threshold": self.queue_threshold,
+            "shed_policy": self.shed_policy,
+            "held": self._held_count,
+            "inflight": len(self._inflight),
+            "admitted": dict(zip(PRIORITY_NAMES, self.admitted)),
+            "delayed": dict(zip(PRIORITY_NAMES, self.delayed)),
+            "shed": dict(zip(PRIORITY_NAMES, self.shed)),
+            "inflight_timeouts": self.inflight_timeouts,
+        }
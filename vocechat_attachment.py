@@ -0,0 +1,352 @@
+# vocechat_attachment.py
+import asyncio
+import base64
+import fnmatch
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+try:
+    from pydantic.v1 import PrivateAttr
+except ImportError:  # 旧版 AstrBot 直接使用 pydantic v1
+    from pydantic import PrivateAttr
+
+from astrbot import logger
+from astrbot.api.message_components import Image, File
+
+# 打开 VoceChat 文件资源的函数：传入 VoceChat file_path，返回 aiohttp 响应的异步上下文管理器
+FileOpener = Callable[[str], AsyncContextManager[Any]]
+
+_CHUNK_SIZE = 256 * 1024
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AttachmentError(Exception):
+    """附件被拒绝或下载失败"""
+
+
+class AttachmentStore:
+    """VoceChat 附件的磁盘缓存。
+
+    以 VoceChat 的 file_path 为键，下载时流式写入磁盘，不会把整个文件读入内存；
+    按总字节数进行 LRU 淘汰；同一文件的并发请求只会下载一次。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_total_bytes: int = 512 * 1024 * 1024,
+        max_file_bytes: int = 20 * 1024 * 1024,
+        allowed_content_types: Optional[List[str]] = None,
+        name: str = "",
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_total_bytes = int(max_total_bytes)
+        self.max_file_bytes = int(max_file_bytes)
+        self.allowed_content_types = [t.lower() for t in (allowed_content_types or ["*/*"])]
+        self.name = name
+
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # 本地文件名 -> 字节数，按最近使用排序
+        self._total_bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self.rejected = 0
+        self.failures = 0
+        self.evictions = 0
+
+        self._load_index()
+
+    def _load_index(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if ".part." in entry.name:
+                # 上次异常退出时残留的临时文件
+                _remove_quietly(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, filename, size in sorted(entries):
+            self._index[filename] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _local_name(file_path: str, display_name: str) -> str:
+        digest = hashlib.sha256(file_path.encode("utf-8")).hexdigest()
+        ext = os.path.splitext(display_name)[1].lower()
+        if not ext or len(ext) > 10 or not ext[1:].isalnum():
+            ext = ""
+        return f"{digest}{ext}"
+
+    def is_allowed(self, content_type: str, declared_size: Optional[int] = None) -> bool:
+        """在下载前根据声明的类型与大小判断附件是否允许下载"""
+        content_type = (content_type or "application/octet-stream").lower()
+        if not any(fnmatch.fnmatch(content_type, pattern) for pattern in self.allowed_content_types):
+            return False
+        if declared_size is not None and self.max_file_bytes > 0 and declared_size > self.max_file_bytes:
+            return False
+        return True
+
+    async def fetch(self, file_path: str, display_name: str, opener: FileOpener) -> str:
+        """返回附件的本地路径，未缓存时下载。
+
+        Raises:
+            AttachmentError: 附件超过大小限制或下载失败
+        """
+        local_name = self._local_name(file_path, display_name)
+        local_path = self.cached_path(local_name)
+        if local_path is not None:
+            self.hits += 1
+            return local_path
+
+        fut = self._inflight.get(local_name)
+        if fut is None:
+            self.misses += 1
+            fut = asyncio.ensure_future(self._download(file_path, local_name, opener))
+            self._inflight[local_name] = fut
+            fut.add_done_callback(lambda _f, k=local_name: self._inflight.pop(k, None))
+        return await asyncio.shield(fut)
+
+    async def _download(self, file_path: str, local_name: str, opener: FileOpener) -> str:
+        local_path = os.path.join(self.cache_dir, local_name)
+        tmp_path = f"{local_path}.part.{uuid.uuid4().hex[:8]}"
+        loop = asyncio.get_running_loop()
+        written = 0
+        try:
+            async with opener(file_path) as resp:
+                if resp.status != 200:
+                    err_text = await resp.text()
+                    self.failures += 1
+                    raise AttachmentError(f"HTTP {resp.status}: {err_text[:200]}")
+                if self.max_file_bytes > 0 and resp.content_length and resp.content_length > self.max_file_bytes:
+                    self.rejected += 1
+                    raise AttachmentError(f"文件大小 {resp.content_length} 超过上限 {self.max_file_bytes}")
+                f = await loop.run_in_executor(None, open, tmp_path, "wb")
+                try:
+                    async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+                        written += len(chunk)
+                        if self.max_file_bytes > 0 and written > self.max_file_bytes:
+                            self.rejected += 1
+                            raise AttachmentError(f"下载超过大小上限 {self.max_file_bytes}")
+                        await loop.run_in_executor(None, f.write, chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+            await loop.run_in_executor(None, os.replace, tmp_path, local_path)
+        except (AttachmentError, asyncio.CancelledError):
+            _remove_quietly(tmp_path)
+            raise
+        except asyncio.TimeoutError as e:
+            self.failures += 1
+            _remove_quietly(tmp_path)
+            raise AttachmentError("下载超时") from e
+        except Exception as e:
+            self.failures += 1
+            _remove_quietly(tmp_path)
+            raise AttachmentError(str(e)) from e
+
+        self.downloads += 1
+        self.bytes_downloaded += written
+        self.add_file(local_name, written)
+        logger.debug(f"AttachmentStore '{self.name}': 已缓存 {file_path} -> {local_path} ({written} 字节)")
+        return local_path
+
+    def cached_path(self, local_name: str) -> Optional[str]:
+        """返回缓存目录中已登记文件的路径并标记为最近使用，不存在时返回 None"""
+        if local_name not in self._index:
+            return None
+        local_path = os.path.join(self.cache_dir, local_name)
+        if not os.path.exists(local_path):
+            # 缓存文件被外部删除
+            self._total_bytes -= self._index.pop(local_name)
+            return None
+        self._index.move_to_end(local_name)
+        return local_path
+
+    def add_file(self, local_name: str, size: int) -> None:
+        """登记一个已写入缓存目录的文件，参与总大小统计与 LRU 淘汰"""
+        self._total_bytes -= self._index.pop(local_name, 0)
+        self._index[local_name] = size
+        self._total_bytes += size
+        self._evict(keep=local_name)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self.max_total_bytes and self._index:
+            oldest = next(iter(self._index))
+            if oldest == keep:
+                if len(self._index) == 1:
+                    break
+                self._index.move_to_end(oldest)
+                continue
+            size = self._index.pop(oldest)
+            self._total_bytes -= size
+            self.evictions += 1
+            _remove_quietly(os.path.join(self.cache_dir, oldest))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._index),
+            "total_bytes": self._total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "downloads": self.downloads,
+            "bytes_downloaded": self.bytes_downloaded,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+        }
+
+
+class VoceChatAttachment:
+    """VoceChat 附件的惰性句柄，只有在首次访问内容时才会下载"""
+
+    def __init__(self, store: AttachmentStore, file_path: str, name: str, content_type: str, size: Optional[int], opener: FileOpener, preprocessor: Optional[Any] = None, url: str = "") -> None:
+        self.store = store
+        self.file_path = file_path
+        self.url = url  # VoceChat 资源地址，供未覆盖的 Image / File 方法与读取 .url 的插件使用
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+        self._opener = opener
+        self._preprocessor = preprocessor  # 可选的 ImagePreprocessor，仅用于图片
+        self.trace: Optional[Any] = None  # 所属消息被抽样追踪时记录首次取得附件的时间
+        self.error: Optional[str] = None  # 最近一次取得失败的原因
+
+    async def get_path(self) -> str:
+        try:
+            path = await self.store.fetch(self.file_path, self.name, self._opener)
+        except (AttachmentError, OSError) as e:
+            self.error = str(e)
+            raise
+        self.error = None
+        if self.trace is not None:
+            self.trace.mark_once("attachment")
+        return path
+
+    async def get_processed_path(self) -> str:
+        """返回经过预处理（缩放、重新压缩）的图片路径；未启用预处理时返回原文件路径"""
+        path = await self.get_path()
+        if self._preprocessor is None:
+            return path
+        return await self._preprocessor.process(path, self.file_path, self.name)
+
+    async def read_bytes(self) -> bytes:
+        path = await self.get_path()
+
+        def _read() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+
+        return await asyncio.to_thread(_read)
+
+    async def to_base64(self, processed: bool = False) -> str:
+        path = await (self.get_processed_path() if processed else self.get_path())
+
+        def _encode() -> str:
+            with open(path, "rb") as f:
+                return base64.b64encode(f.read()).decode("utf-8")
+
+        # 大图的 base64 编码同样放到线程中，避免占用事件循环
+        return await asyncio.to_thread(_encode)
+
+
+class VoceChatImage(Image):
+    """VoceChat 图片组件：图片内容在 convert_to_file_path / convert_to_base64 时才下载。
+
+    下载失败时与 File.get_file 一致返回空字符串，不向流水线抛出异常；
+    插件的 on_llm_request 钩子会用 strip_failed_images 把失败的图片换成 "[图片下载失败: 文件名]" 文本。
+    """
+
+    _attachment: Any = PrivateAttr(default=None)
+
+    def __init__(self, attachment: VoceChatAttachment, **_):
+        super().__init__(file=attachment.url, url=attachment.url, **_)
+        self._attachment = attachment
+
+    @property
+    def attachment(self) -> VoceChatAttachment:
+        return self._attachment
+
+    @property
+    def failed(self) -> bool:
+        return self._attachment.error is not None
+
+    @property
+    def failure_text(self) -> str:
+        return f"[图片下载失败: {self._attachment.name}]"
+
+    async def convert_to_file_path(self) -> str:
+        try:
+            path = await self._attachment.get_processed_path()
+        except (AttachmentError, OSError) as e:
+            logger.warning(f"VoceChatImage: 获取图片 '{self._attachment.name}' ({self.url}) 失败: {e}")
+            return ""
+        self.file = f"file:///{path}"
+        self.path = path
+        return path
+
+    async def convert_to_base64(self) -> str:
+        try:
+            return await self._attachment.to_base64(processed=True)
+        except (AttachmentError, OSError) as e:
+            logger.warning(f"VoceChatImage: 获取图片 '{self._attachment.name}' ({self.url}) 失败: {e}")
+            return ""
+
+
+class VoceChatFile(File):
+    """VoceChat 文件组件：文件内容在 get_file 时才下载"""
+
+    _attachment: Any = PrivateAttr(default=None)
+
+    def __init__(self, attachment: VoceChatAttachment):
+        super().__init__(name=attachment.name, url=attachment.url)
+        self._attachment = attachment
+
+    @property
+    def attachment(self) -> VoceChatAttachment:
+        return self._attachment
+
+    async def get_file(self, allow_return_url: bool = False) -> str:
+        try:
+            path = await self._attachment.get_path()
+        except (AttachmentError, OSError) as e:
+            # 与 File.get_file 下载失败时一致：允许时返回下载地址，否则返回空字符串
+            logger.warning(f"VoceChatFile: 获取文件 '{self._attachment.name}' ({self.url}) 失败: {e}")
+            return self.url if allow_return_url else ""
+        self.file_ = path
+        return path
+
+
+def strip_failed_images(components: List[Any], request: Any) -> int:
+    """从 LLM 请求中去掉下载失败的图片，改为在提示词末尾附上 "[图片下载失败: 文件名]"。
+
+    request 为 AstrBot 的 ProviderRequest。返回处理的图片数。
+    """
+    failed = [c for c in components if isinstance(c, VoceChatImage) and c.failed]
+    if not failed:
+        return 0
+    request.image_urls = [url for url in request.image_urls if url]
+    # AstrBot 会为每张图片附加 "[Image Attachment: path ...]"，路径为空的条目对应失败的图片
+    request.extra_user_content_parts = [
+        part for part in request.extra_user_content_parts
+        if getattr(part, "text", None) != "[Image Attachment: path ]"
+    ]
+    markers = "\n".join(c.failure_text for c in failed)
+    request.prompt = f"{request.prompt}\n{markers}" if request.prompt else markers
+    return len(failed)
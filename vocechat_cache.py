@@ -0,0 +1,191 @@
+# vocechat_cache.py
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from astrbot import logger
+
+# 缓存条目: (值, 过期时间戳)。值为 None 表示负缓存（查询失败 / 用户不存在）
+_Entry = Tuple[Optional[str], float]
+
+
+class AsyncLRUCache:
+    """异步加载缓存：容量上限 + LRU 淘汰、TTL 过期、负缓存与同 key 并发查询合并。
+
+    - 正常条目在 ttl 秒后过期；开启 stale_while_revalidate 时，过期条目仍会立即返回，
+      同时在后台刷新。
+    - loader 返回 None 或抛出异常时写入负缓存，在 negative_ttl 秒内不再重复查询。
+    - 同一个 key 的并发未命中只会触发一次 loader 调用。
+    - 可通过 save()/load() 持久化到磁盘，重启后直接预热。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 5000,
+        ttl: float = 3600.0,
+        negative_ttl: float = 60.0,
+        stale_while_revalidate: bool = True,
+        persist_path: str = "",
+        name: str = "",
+    ) -> None:
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self.stale_while_revalidate = bool(stale_while_revalidate)
+        self.persist_path = persist_path
+        self.name = name
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _set(self, key: str, value: Optional[str]) -> None:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def peek(self, key: str) -> Optional[str]:
+        """不触发查询，直接读取缓存中的值（包括已过期的值）"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    async def get(self, key: str, loader: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+        """读取缓存，未命中时调用 loader 加载。
+
+        Returns:
+            Optional[str]: 缓存值；None 表示查询失败（调用方应使用默认值）
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            self._entries.move_to_end(key)
+            if time.time() < expires_at:
+                if value is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return value
+            if value is not None and self.stale_while_revalidate:
+                self.stale_hits += 1
+                self._start_load(key, loader)
+                return value
+        self.misses += 1
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def _start_load(self, key: str, loader: Callable[[str], Awaitable[Optional[str]]]) -> asyncio.Future:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return fut
+        fut = asyncio.ensure_future(self._run_loader(key, loader))
+        self._inflight[key] = fut
+        fut.add_done_callback(lambda _f, k=key: self._inflight.pop(k, None))
+        return fut
+
+    async def _run_loader(self, key: str, loader: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+        self.loads += 1
+        try:
+            value = await loader(key)
+        except Exception as e:
+            logger.error(f"{type(self).__name__} '{self.name}': 加载 {key} 失败: {e}", exc_info=True)
+            value = None
+        if value is None:
+            self.load_failures += 1
+            # 查询失败时保留旧值，避免一次超时把已知的值刷掉
+            previous = self._entries.get(key)
+            if previous is not None and previous[0] is not None:
+                self._entries[key] = (previous[0], time.time() + self.negative_ttl)
+                return previous[0]
+        self._set(key, value)
+        return value
+
+    def save(self) -> None:
+        """将正常条目写入 persist_path（原子替换）"""
+        if not self.persist_path:
+            return
+        data = {k: [v, exp] for k, (v, exp) in self._entries.items() if v is not None}
+        try:
+            directory = os.path.dirname(os.path.abspath(self.persist_path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"{type(self).__name__} '{self.name}': 已保存 {len(data)} 条缓存到 {self.persist_path}")
+        except OSError as e:
+            logger.error(f"{type(self).__name__} '{self.name}': 保存缓存失败: {e}")
+
+    def load(self) -> None:
+        """从 persist_path 加载缓存。已过期的条目也会被加载，首次访问时按 stale 处理并后台刷新。"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            # 文件截断或损坏（含编码错误）时以空缓存启动
+            logger.error(f"{type(self).__name__} '{self.name}': 读取缓存失败，将以空缓存启动: {e}")
+            return
+        if not isinstance(data, dict):
+            logger.error(f"{type(self).__name__} '{self.name}': 缓存文件格式无效（应为 JSON 对象），将以空缓存启动")
+            return
+        items = [
+            (str(key), item[0], float(item[1]))
+            for key, item in data.items()
+            if isinstance(item, list) and len(item) == 2 and isinstance(item[0], str) and isinstance(item[1], (int, float)) and not isinstance(item[1], bool)
+        ]
+        if len(items) < len(data):
+            logger.warning(f"{type(self).__name__} '{self.name}': 忽略缓存文件中 {len(data) - len(items)} 条格式无效的条目")
+        for key, value, expires_at in sorted(items, key=lambda kv: kv[2]):
+            self._entries[key] = (value, expires_at)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        logger.info(f"{type(self).__name__} '{self.name}': 已从 {self.persist_path} 预热 {len(self._entries)} 条缓存")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_ratio": ((self.hits + self.stale_hits + self.negative_hits) / lookups) if lookups else 0.0,
+        }
+
+
+class UserInfoCache(AsyncLRUCache):
+    """VoceChat 用户昵称缓存，键为用户 uid"""
+
+
+class UploadedFileCache(AsyncLRUCache):
+    """已上传文件缓存：内容哈希 -> VoceChat 上传结果 JSON。
+
+    同一内容并发发送到多个会话时只会上传一次；上传失败不做负缓存，下次发送会重新上传。
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600.0, name: str = "") -> None:
+        super().__init__(max_size=max_size, ttl=ttl, negative_ttl=0.0, stale_while_revalidate=False, name=name)
@@ -0,0 +1,150 @@
+# vocechat_capture.py
+import copy
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+from astrbot import logger
+
+_NON_SPACE = re.compile(r"\S")
+
+
+def _mask_text(text: str) -> str:
+    """保留长度与空白结构；以 "/" 开头的指令保留指令名，@提及保留被提及的 ID"""
+    head = ""
+    if text.startswith("/"):
+        head, _, text = text.partition(" ")
+        if text:
+            head += " "
+    parts = re.split(r"(@\d+)", text)
+    return head + "".join(part if part.startswith("@") else _NON_SPACE.sub("x", part) for part in parts)
+
+
+def _mask_name(name: Any) -> Any:
+    if not isinstance(name, str):
+        return name
+    _, ext = os.path.splitext(name)
+    return f"redacted{ext}"
+
+
+def redact_payload(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """返回去除消息文本与文件名、用户名的副本，保留结构、长度与 ID，回放时的处理开销与原始流量相近"""
+    data = copy.deepcopy(raw)
+    detail = data.get("detail")
+    if not isinstance(detail, dict):
+        return data
+    if detail.get("content_type") in ("text/plain", "text/markdown") and isinstance(detail.get("content"), str):
+        detail["content"] = _mask_text(detail["content"])
+    properties = detail.get("properties")
+    if isinstance(properties, dict):
+        if "name" in properties:
+            properties["name"] = _mask_name(properties["name"])
+        for file_info in properties.get("files") or []:
+            if isinstance(file_info, dict) and "name" in file_info:
+                file_info["name"] = _mask_name(file_info["name"])
+        user = properties.get("user")
+        if isinstance(user, dict) and "name" in user:
+            user["name"] = "redacted"
+    return data
+
+
+class _RecordFormatter(logging.Formatter):
+    """在写入线程中完成脱敏与 JSON 序列化"""
+
+    def __init__(self, redact: bool) -> None:
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = getattr(record, "vc_line", None)
+        if line is None:  # 判断是否需要轮转时也会调用 format，只序列化一次
+            received_at, raw = record.msg
+            line = json.dumps({"ts": received_at, "payload": redact_payload(raw) if self.redact else raw}, ensure_ascii=False)
+            record.vc_line = line
+        return line
+
+
+class _RecordFileHandler(RotatingFileHandler):
+    def __init__(self, recorder: "TrafficRecorder", *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._recorder = recorder
+        self._failed = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._failed = False
+        super().emit(record)
+        if not self._failed:
+            self._recorder.recorded += 1
+
+    def handleError(self, record: logging.LogRecord) -> None:
+        # logging 默认把异常打印到 stderr 后继续；这里计入统计并记录第一次错误
+        self._failed = True
+        self._recorder._on_write_error(sys.exc_info()[1])
+
+
+class TrafficRecorder:
+    """把收到的原始 Webhook 数据按行写入 JSONL 文件，超过 max_bytes 时轮转，最多保留 backups 个旧文件。
+
+    每行格式: {"ts": 接收时间（Unix 秒）, "payload": Webhook 数据}。redact 为 True 时去除消息文本、文件名与用户名。
+    脱敏、序列化与文件写入都在后台线程中进行，record() 只把数据放入队列；队列中超过 max_pending 条时丢弃新数据。
+    记录的文件可用 benchmarks/replay.py 回放。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backups: int = 5, redact: bool = True, max_pending: int = 10000, name: str = "") -> None:
+        self.path = path
+        self.redact = redact
+        self.name = name
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._handler = _RecordFileHandler(self, path, maxBytes=max(0, int(max_bytes)), backupCount=max(0, int(backups)), encoding="utf-8", delay=True)
+        self._handler.setFormatter(_RecordFormatter(redact))
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._listener = QueueListener(self._queue, self._handler)
+        self._listener.start()
+        self._closed = False
+
+        self.queued = 0
+        self.recorded = 0  # 已写入文件的条数，由写入线程更新
+        self.dropped = 0
+        self.errors = 0
+
+    def record(self, raw: Dict[str, Any], received_at: float = 0.0) -> None:
+        if self._closed:
+            return
+        record = logging.LogRecord(self.name, logging.INFO, "", 0, (received_at or time.time(), raw), None, None)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:  # 磁盘写入跟不上时丢弃，不能影响消息处理
+            self.dropped += 1
+            return
+        self.queued += 1
+
+    def _on_write_error(self, error: Optional[BaseException]) -> None:
+        self.errors += 1
+        if self.errors == 1:
+            logger.error(f"TrafficRecorder '{self.name}': 写入 {self.path} 失败: {error}")
+
+    def close(self) -> None:
+        """写完队列中剩余的数据后关闭文件（会阻塞到后台线程结束）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._listener.stop()
+        self._handler.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "redact": self.redact,
+            "queued": self.queued,
+            "recorded": self.recorded,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
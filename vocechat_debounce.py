@@ -0,0 +1,125 @@
+# vocechat_debounce.py
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from astrbot.api.platform import AstrBotMessage, MessageType
+from astrbot.api.message_components import Plain, Image
+
+_Key = Tuple[str, str]  # (session_id, 发送者 ID)
+
+
+class _Pending:
+    __slots__ = ("messages", "first_at", "timer")
+
+    def __init__(self, message: AstrBotMessage, first_at: float) -> None:
+        self.messages: List[AstrBotMessage] = [message]
+        self.first_at = first_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MessageAggregator:
+    """把同一会话中同一发送者连续发送的文本 / 图片消息合并为一条。
+
+    每条新消息把等待时间重置为 window_ms；从第一条消息起最多等待 max_window_ms，
+    累计 max_messages 条时立即合并提交。其他类型的消息（文件、事件）与以 "/" 开头的指令不参与合并，
+    到达时会先提交该发送者已缓冲的消息，保证顺序。被并入后一条的消息会传给 on_merged(被并入的消息, 合并结果)。
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[AstrBotMessage], None],
+        window_ms: float,
+        max_window_ms: float = 3000.0,
+        max_messages: int = 5,
+        on_merged: Optional[Callable[[AstrBotMessage, AstrBotMessage], None]] = None,
+        name: str = "",
+    ) -> None:
+        self._emit = emit
+        self._on_merged = on_merged
+        self.window = max(0.0, float(window_ms)) / 1000
+        self.max_window = max(self.window, float(max_window_ms) / 1000)
+        self.max_messages = max(1, int(max_messages))
+        self.name = name
+
+        self._pending: Dict[_Key, _Pending] = {}
+
+        self.received = 0
+        self.emitted = 0
+        self.merged_messages = 0
+        self.flushed_by_cap = 0
+
+    @staticmethod
+    def _mergeable(message: AstrBotMessage) -> bool:
+        if message.type not in (MessageType.FRIEND_MESSAGE, MessageType.GROUP_MESSAGE):
+            return False
+        if (message.message_str or "").startswith("/"):
+            return False
+        return all(isinstance(c, (Plain, Image)) for c in message.message)
+
+    def add(self, message: AstrBotMessage) -> None:
+        self.received += 1
+        key = (message.session_id, message.sender.user_id)
+        if not self._mergeable(message):
+            self.flush(key)
+            self._send(message)
+            return
+
+        now = time.monotonic()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _Pending(message, now)
+            self._pending[key] = pending
+        else:
+            pending.messages.append(message)
+            pending.timer.cancel()
+        if len(pending.messages) >= self.max_messages:
+            self.flushed_by_cap += 1
+            self.flush(key)
+            return
+        delay = min(self.window, pending.first_at + self.max_window - now)
+        pending.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self.flush, key)
+
+    def flush(self, key: _Key) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        self._send(self._merge(pending.messages))
+
+    def flush_all(self) -> None:
+        for key in list(self._pending):
+            self.flush(key)
+
+    def _send(self, message: AstrBotMessage) -> None:
+        self.emitted += 1
+        self._emit(message)
+
+    def _merge(self, messages: List[AstrBotMessage]) -> AstrBotMessage:
+        if len(messages) == 1:
+            return messages[0]
+        self.merged_messages += len(messages)
+        # 以最后一条为基础，回复时引用的是最新的消息
+        merged = messages[-1]
+        components: List[Any] = []
+        for m in messages:
+            components.extend(m.message)
+        merged.message = components
+        merged.message_str = "\n".join(m.message_str for m in messages if m.message_str)
+        if self._on_merged is not None:
+            for m in messages[:-1]:
+                self._on_merged(m, merged)
+        return merged
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "max_window_ms": self.max_window * 1000,
+            "max_messages": self.max_messages,
+            "pending_sessions": len(self._pending),
+            "received": self.received,
+            "emitted": self.emitted,
+            "merged_messages": self.merged_messages,
+            "flushed_by_cap": self.flushed_by_cap,
+        }
@@ -0,0 +1,125 @@
+# vocechat_dedupe.py
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Set
+
+from astrbot import logger
+
+
+class RecentIdSet:
+    """按时间窗口保留最近见过的消息 ID，用于丢弃重复投递的 Webhook。
+
+    - begin() 把新 ID 标记为处理中，处理成功后 commit() 才计入窗口，失败时 discard() 允许重投；
+      处理中的 ID 再次到达时不视为重复，由调用方要求稍后重试，避免首次处理失败后消息丢失。
+    - 超过 window 秒的 ID 会被移除；条目数超过 max_size 时淘汰最早的 ID。
+    - 可通过 save()/load() 持久化到磁盘，重启后仍能识别窗口内的重复消息。
+    """
+
+    def __init__(self, window: float = 600.0, max_size: int = 10000, persist_path: str = "", name: str = "") -> None:
+        self.window = float(window)
+        self.max_size = max(1, int(max_size))
+        self.persist_path = persist_path
+        self.name = name
+
+        # ID -> 首次见到的时间戳，按插入顺序排列
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._in_progress: Set[str] = set()
+
+        self.checked = 0
+        self.duplicates = 0
+        self.in_progress_hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff:
+                break
+            self._seen.popitem(last=False)
+
+    def begin(self, key: str) -> str:
+        """开始处理一个 ID
+
+        Returns:
+            str: "new"（已标记为处理中）、"duplicate"（窗口内已处理过）或 "in_progress"（正在处理）
+        """
+        self._expire(time.time())
+        self.checked += 1
+        if key in self._seen:
+            self.duplicates += 1
+            return "duplicate"
+        if key in self._in_progress:
+            self.in_progress_hits += 1
+            return "in_progress"
+        self._in_progress.add(key)
+        return "new"
+
+    def commit(self, key: str) -> None:
+        """处理成功，之后窗口内再次到达的同一 ID 视为重复"""
+        self._in_progress.discard(key)
+        self._seen[key] = time.time()
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        """移除一个 ID，使其下次重投时能被重新处理（用于处理失败的消息）"""
+        self._in_progress.discard(key)
+        self._seen.pop(key, None)
+
+    def save(self) -> None:
+        """将窗口内的 ID 写入 persist_path（原子替换）"""
+        if not self.persist_path:
+            return
+        self._expire(time.time())
+        try:
+            directory = os.path.dirname(os.path.abspath(self.persist_path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self._seen.items()), f)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"{type(self).__name__} '{self.name}': 已保存 {len(self._seen)} 个消息 ID 到 {self.persist_path}")
+        except OSError as e:
+            logger.error(f"{type(self).__name__} '{self.name}': 保存消息 ID 失败: {e}")
+
+    def load(self) -> None:
+        """从 persist_path 加载仍在窗口内的 ID"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"{type(self).__name__} '{self.name}': 读取消息 ID 失败: {e}")
+            return
+        if not isinstance(data, list):
+            return
+        cutoff = time.time() - self.window
+        items = [(str(item[0]), float(item[1])) for item in data if isinstance(item, list) and len(item) == 2 and isinstance(item[1], (int, float))]
+        for key, seen_at in sorted(items, key=lambda kv: kv[1]):
+            if seen_at >= cutoff:
+                self._seen[key] = seen_at
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        logger.info(f"{type(self).__name__} '{self.name}': 已从 {self.persist_path} 加载 {len(self._seen)} 个消息 ID")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._seen),
+            "max_size": self.max_size,
+            "window": self.window,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "in_progress": len(self._in_progress),
+            "in_progress_hits": self.in_progress_hits,
+            "evictions": self.evictions,
+            "duplicate_ratio": (self.duplicates / self.checked) if self.checked else 0.0,
+        }
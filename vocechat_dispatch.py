@@ -0,0 +1,271 @@
+# vocechat_dispatch.py
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+from astrbot import logger
+
+# 可以确定请求尚未发出的错误（连接失败、连接超时）。读取响应超时或连接中途断开时服务器可能已经收到消息，
+# 重新发送会产生重复消息，因此不重试
+PRE_SEND_ERRORS: Tuple[type, ...] = (aiohttp.ClientConnectorError,) + ((aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, "ConnectionTimeoutError") else ())
+
+
+class RetryableSendError(Exception):
+    """可重试的发送失败（429 / 5xx）"""
+
+    def __init__(self, message: str, status: int = 0, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（仅支持秒数形式）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value.strip()))
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """令牌桶限速器，rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return waited
+            delay = (1.0 - self._tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+    def idle_since(self, now: float) -> float:
+        """令牌已补满时返回距上次取令牌的秒数，否则返回 0。补满的桶与新建的桶等价，可以丢弃"""
+        if self.rate > 0 and self._tokens + (now - self._updated) * self.rate < self.capacity:
+            return 0.0
+        return now - self._updated
+
+
+class OutboundDispatcher:
+    """出站消息调度器。
+
+    每个发送目标（用户 / 频道）拥有独立的 FIFO 队列和 worker，保证同一目标内的消息顺序，
+    不同目标之间并发发送；单次 HTTP 请求受全局与单目标令牌桶限速，并在 429 / 5xx /
+    连接失败时按带抖动的指数退避重试（优先遵循 Retry-After）。
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 20.0,
+        global_burst: float = 40.0,
+        per_target_rate: float = 5.0,
+        per_target_burst: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        idle_timeout: float = 30.0,
+        name: str = "",
+    ) -> None:
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_target_rate = float(per_target_rate)
+        self.per_target_burst = float(per_target_burst)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.idle_timeout = float(idle_timeout)
+        self.name = name
+
+        self._targets: Dict[str, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        self._target_buckets: Dict[str, TokenBucket] = {}
+        self._buckets_swept_at = time.monotonic()
+
+        self.jobs_submitted = 0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.gave_up = 0
+        self.throttle_wait_seconds = 0.0
+
+    def submit(self, target_key: str, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """把一个发送任务加入目标队列，返回任务结果的 Future"""
+        fut = asyncio.get_running_loop().create_future()
+        entry = self._targets.get(target_key)
+        if entry is None:
+            queue: asyncio.Queue = asyncio.Queue()
+            task = asyncio.create_task(self._target_worker(target_key, queue))
+            entry = (queue, task)
+            self._targets[target_key] = entry
+        entry[0].put_nowait((job, fut))
+        self.jobs_submitted += 1
+        return fut
+
+    async def _target_worker(self, target_key: str, queue: asyncio.Queue) -> None:
+        while True:
+            entry = await self._next_job(queue)
+            if entry is None:
+                if queue.empty():
+                    # 空闲的目标释放 worker，下次提交时重新创建
+                    self._targets.pop(target_key, None)
+                    self._target_buckets.pop(target_key, None)
+                    return
+                continue
+            job, fut = entry
+            try:
+                result = await job()
+                self.jobs_done += 1
+                if not fut.done():
+                    fut.set_result(result)
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.cancel()
+                raise
+            except Exception as e:
+                self.jobs_failed += 1
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                queue.task_done()
+
+    async def _next_job(self, queue: asyncio.Queue) -> Optional[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]]:
+        """取出下一个任务，idle_timeout 秒内没有任务时返回 None
+
+        不对 queue.get() 使用 wait_for：Python 3.11 及更早版本中，超时取消可能恰好发生在取出任务之后，任务会丢失。
+        """
+        try:
+            return queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        getter = asyncio.ensure_future(queue.get())
+        try:
+            done, _ = await asyncio.wait({getter}, timeout=self.idle_timeout)
+        except asyncio.CancelledError:
+            if getter.done() and not getter.cancelled():
+                # 已取出但来不及处理的任务，通知等待方
+                _, fut = getter.result()
+                if not fut.done():
+                    fut.cancel()
+                queue.task_done()
+            else:
+                getter.cancel()
+            raise
+        if done:
+            return getter.result()
+        # 尚未完成的 get() 被取消时不会取出队列中的任务
+        getter.cancel()
+        return None
+
+    async def throttle(self, target_key: str) -> None:
+        waited = await self._global_bucket.acquire()
+        if self.per_target_rate > 0:
+            self._sweep_buckets()
+            bucket = self._target_buckets.get(target_key)
+            if bucket is None:
+                bucket = TokenBucket(self.per_target_rate, self.per_target_burst)
+                self._target_buckets[target_key] = bucket
+            waited += await bucket.acquire()
+        self.throttle_wait_seconds += waited
+
+    def _sweep_buckets(self) -> None:
+        """每 idle_timeout 秒最多一次，丢弃空闲超过 idle_timeout 且已补满的单目标令牌桶。
+
+        待投递消息与消息编辑不经过目标 worker 也会创建令牌桶，不清理时会随目标数量一直增长。
+        """
+        now = time.monotonic()
+        if now - self._buckets_swept_at < self.idle_timeout:
+            return
+        self._buckets_swept_at = now
+        for key in [k for k, b in self._target_buckets.items() if b.idle_since(now) >= self.idle_timeout]:
+            del self._target_buckets[key]
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, max(self.backoff_max, 60.0)))
+        return delay
+
+    async def call_with_retry(self, target_key: str, send_once: Callable[[], Awaitable[Any]], desc: str = "") -> Any:
+        """限速后执行一次 HTTP 发送，可重试的错误按退避策略重试，重试耗尽后抛出最后一次的异常
+
+        只重试服务器明确拒绝 (429 / 5xx) 与请求尚未发出 (PRE_SEND_ERRORS) 的情况；读取超时等错误直接抛出，避免重复发送。
+        """
+        attempt = 0
+        while True:
+            await self.throttle(target_key)
+            self.requests += 1
+            try:
+                return await send_once()
+            except (RetryableSendError, *PRE_SEND_ERRORS) as e:
+                retry_after = None
+                if isinstance(e, RetryableSendError):
+                    retry_after = e.retry_after
+                    if e.status == 429:
+                        self.rate_limited += 1
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    raise
+                delay = self._backoff_delay(attempt, retry_after)
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"OutboundDispatcher '{self.name}': 发送到 {target_key} 失败 ({type(e).__name__}: {e}) {desc}，{delay:.2f} 秒后第 {attempt} 次重试。")
+                await asyncio.sleep(delay)
+
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue, _ in self._targets.values())
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """在 drain_timeout 内等待已排队的发送完成，然后停止所有 worker"""
+        entries = list(self._targets.values())
+        if not entries:
+            return
+        pending = self.queue_depth()
+        if pending:
+            logger.info(f"OutboundDispatcher '{self.name}': 等待 {pending} 个排队中的发送任务完成（最多 {drain_timeout} 秒）...")
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue, _ in entries)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"OutboundDispatcher '{self.name}': 等待发送队列排空超时，剩余 {self.queue_depth()} 个任务将被丢弃。")
+        for _, task in entries:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in entries), return_exceptions=True)
+        for queue, _ in entries:
+            while not queue.empty():
+                _, fut = queue.get_nowait()
+                if not fut.done():
+                    fut.cancel()
+        self._targets.clear()
+        self._target_buckets.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_targets": len(self._targets),
+            "target_buckets": len(self._target_buckets),
+            "queued_jobs": self.queue_depth(),
+            "jobs_submitted": self.jobs_submitted,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "gave_up": self.gave_up,
+            "throttle_wait_seconds": self.throttle_wait_seconds,
+        }
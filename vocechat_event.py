@@ -3,7 +3,9 @@ from astrbot.api.event import AstrMessageEvent, MessageChain
 from astrbot.api.platform import AstrBotMessage, PlatformMetadata, MessageType # 确保 MessageType 被导入
 from astrbot import logger 
 from astrbot.api.message_components import Plain
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from .vocechat_trace import Trace, current_trace
 
 # 从正确的位置导入 MessageSesion (单s)
 from astrbot.core.platform.astr_message_event import MessageSesion 
@@ -16,6 +18,7 @@ if TYPE_CHECKING:
 
 class VoceChatEvent(AstrMessageEvent):
     adapter: 'VoceChatAdapter' # 类型提示，实际在 __init__ 中赋值
+    _vc_trace: Optional[Trace] = None # 被抽样追踪时由适配器设置；AstrMessageEvent 自身已占用 trace 属性 (TraceSpan)
 
     def __init__(self, message_obj: AstrBotMessage, platform_meta: PlatformMetadata, adapter_instance: 'VoceChatAdapter'):
         # --- 从 message_obj 中获取 message_str 和 session_id ---
@@ -61,6 +64,26 @@ class VoceChatEvent(AstrMessageEvent):
         )
         
         self.adapter = adapter_instance # 保存适配器实例，以便 send 方法调用
+        self._vc_done_callbacks: Optional[List[Callable[['VoceChatEvent'], None]]] = [] # 处理完成后置为 None
+
+    def add_done_callback(self, callback: Callable[['VoceChatEvent'], None]) -> None:
+        """注册事件处理完成时调用的函数；AstrBot 没有流水线结束的回调，以回复发送完毕或事件被终止为准"""
+        if self._vc_done_callbacks is None:
+            callback(self)
+        else:
+            self._vc_done_callbacks.append(callback)
+
+    def _mark_done(self) -> None:
+        callbacks, self._vc_done_callbacks = self._vc_done_callbacks, None
+        for callback in callbacks or ():
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"VoceChatEvent: 处理完成回调执行失败: {e}", exc_info=True)
+
+    def stop_event(self):
+        super().stop_event()
+        self._mark_done()
 
     async def send(self, message_chain: MessageChain):
         logger.info(f"VoceChatEvent.send() 被调用，准备通过适配器发送消息。Event Session (self.session): {self.session}")
@@ -69,10 +92,16 @@ class VoceChatEvent(AstrMessageEvent):
             # AstrMessageEvent 基类的 __init__ 已经创建了 self.session，其类型为 MessageSesion (单s)。
             # VoceChatAdapter 的 send_by_session 方法参数 session 也期望是 MessageSesion 类型。
             # 所以我们直接传递 self.session。
-            await self.adapter.send_by_session(
-                session=self.session, # <--- 使用由基类创建的 self.session (MessageSesion 类型)
-                message_chain=message_chain
-            )
+            if self._vc_trace is not None: self._vc_trace.mark("send_start")
+            token = current_trace.set(self._vc_trace)
+            try:
+                await self.adapter.send_by_session(
+                    session=self.session, # <--- 使用由基类创建的 self.session (MessageSesion 类型)
+                    message_chain=message_chain
+                )
+            finally:
+                current_trace.reset(token)
+                self._mark_done()
             logger.info(f"VoceChatEvent.send(): 消息已尝试通过适配器发送。")
         else:
             logger.error("VoceChatEvent.send(): 无法发送消息，因为 adapter 实例未设置！")
@@ -81,3 +110,16 @@ class VoceChatEvent(AstrMessageEvent):
         # (例如，它可能会做一些统计或标记操作)
         await super().send(message_chain)
 
+    async def send_streaming(self, generator, use_fallback: bool = False):
+        # 流式输出：由适配器先发送首段文本，再通过编辑同一条消息追加后续内容；
+        # use_fallback 对应 AstrBot 的实时分段设置，此时按句子分条发送
+        if hasattr(self, 'adapter') and self.adapter:
+            if self._vc_trace is not None: self._vc_trace.mark("send_start")
+            try:
+                await self.adapter.send_streaming_by_session(session=self.session, generator=generator, segmented=use_fallback)
+            finally:
+                self._mark_done()
+            if self._vc_trace is not None: self._vc_trace.mark("stream_end")
+        else:
+            logger.error("VoceChatEvent.send_streaming(): 无法发送消息，因为 adapter 实例未设置！")
+        await super().send_streaming(generator, use_fallback)
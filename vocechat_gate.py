@@ -0,0 +1,127 @@
+# vocechat_gate.py
+import hmac
+import ipaddress
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiohttp import web
+
+from astrbot import logger
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+REJECT_REASONS = ("forbidden_ip", "bad_secret", "content_type", "too_large", "invalid_payload")
+
+
+class BodyTooLargeError(Exception):
+    pass
+
+
+def _parse_networks(entries: List[str], name: str) -> List[IPNetwork]:
+    networks: List[IPNetwork] = []
+    for entry in entries:
+        entry = str(entry).strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            logger.warning(f"WebhookGate '{name}': 忽略无效的 IP 白名单条目 '{entry}'。")
+    return networks
+
+
+class WebhookGate:
+    """在读取和解析请求体之前拒绝不合规的 Webhook 请求。
+
+    依次检查来源 IP 白名单、共享密钥（请求头或 URL 查询参数）与 Content-Type，均通过后按块读取请求体，
+    超过 max_body_bytes 立即停止读取。每种拒绝原因分别计数，日志每 log_interval 秒最多输出一条，
+    期间被抑制的条数随下一条日志一并报告。
+    """
+
+    def __init__(
+        self,
+        max_body_bytes: int = 1024 * 1024,
+        content_types: Optional[List[str]] = None,
+        secret: str = "",
+        secret_header: str = "X-VoceChat-Secret",
+        secret_param: str = "secret",
+        allow_ips: Optional[List[str]] = None,
+        log_interval: float = 10.0,
+        name: str = "",
+    ) -> None:
+        self.max_body_bytes = max(0, int(max_body_bytes))
+        self.content_types = {t.strip().lower() for t in (content_types or []) if t.strip()}
+        self._secret = secret.encode("utf-8")
+        self.secret_header = secret_header
+        self.secret_param = secret_param
+        self.name = name
+        self._networks = _parse_networks(allow_ips or [], name)
+        self.log_interval = max(0.0, float(log_interval))
+
+        self.rejected: Dict[str, int] = {reason: 0 for reason in REJECT_REASONS}
+        self._last_log: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def check_source(self, request: web.Request) -> Optional[Tuple[int, str]]:
+        """检查来源 IP 与共享密钥，不通过时返回 (状态码, 拒绝原因)"""
+        if self._networks:
+            try:
+                remote = ipaddress.ip_address(request.remote or "")
+            except ValueError:
+                remote = None
+            if remote is None or not any(remote in network for network in self._networks):
+                return 403, "forbidden_ip"
+        if self._secret:
+            provided = request.headers.get(self.secret_header) or request.query.get(self.secret_param) or ""
+            if not hmac.compare_digest(provided.encode("utf-8"), self._secret):
+                return 403, "bad_secret"
+        return None
+
+    def check(self, request: web.Request) -> Optional[Tuple[int, str]]:
+        """读取请求体之前的全部检查，不通过时返回 (状态码, 拒绝原因)"""
+        rejection = self.check_source(request)
+        if rejection is not None:
+            return rejection
+        # 未声明 Content-Type 的请求放行，由 JSON 解析判断
+        if self.content_types and "Content-Type" in request.headers and request.content_type.lower() not in self.content_types:
+            return 415, "content_type"
+        if self.max_body_bytes and request.content_length is not None and request.content_length > self.max_body_bytes:
+            return 413, "too_large"
+        return None
+
+    async def read_body(self, request: web.Request) -> bytes:
+        """按块读取请求体，超过 max_body_bytes 时抛出 BodyTooLargeError（未声明 Content-Length 的请求也受限制）"""
+        if not self.max_body_bytes:
+            return await request.read()
+        chunks: List[bytes] = []
+        size = 0
+        async for chunk in request.content.iter_any():
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise BodyTooLargeError(f"请求体超过 {self.max_body_bytes} 字节")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def reject(self, reason: str, request: web.Request, detail: str = "") -> None:
+        """记录一次拒绝，按原因限制日志频率"""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        now = time.monotonic()
+        if now - self._last_log.get(reason, float("-inf")) < self.log_interval:
+            self._suppressed[reason] = self._suppressed.get(reason, 0) + 1
+            return
+        self._last_log[reason] = now
+        suppressed = self._suppressed.pop(reason, 0)
+        message = f"WebhookGate '{self.name}': 拒绝来自 {request.remote} 的 Webhook 请求 ({reason})"
+        if detail:
+            message += f": {detail}"
+        if suppressed:
+            message += f"（此前 {self.log_interval:g} 秒内另有 {suppressed} 条同类请求未记录）"
+        logger.warning(message)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_body_bytes": self.max_body_bytes,
+            "secret_required": bool(self._secret),
+            "allow_ips": [str(network) for network in self._networks],
+            "rejected": dict(self.rejected),
+        }
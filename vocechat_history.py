@@ -0,0 +1,86 @@
+# vocechat_history.py
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class HistoryEntry:
+    __slots__ = ("mid", "sender_id", "sender_nickname", "time", "message_str", "chain")
+
+    def __init__(self, mid: str, sender_id: str, sender_nickname: str, time: int, message_str: str, chain: List[Any]) -> None:
+        self.mid = mid
+        self.sender_id = sender_id
+        self.sender_nickname = sender_nickname
+        self.time = time
+        self.message_str = message_str
+        self.chain = chain
+
+
+class MessageHistory:
+    """按会话保存最近的消息（包括机器人自己发送的），用于在本地解析回复引用的消息。
+
+    每个会话最多保留 max_per_session 条，全部会话合计最多 max_total 条，超出时淘汰最早的消息。
+    """
+
+    def __init__(self, max_per_session: int = 200, max_total: int = 10000) -> None:
+        self.max_per_session = max(1, int(max_per_session))
+        self.max_total = max(1, int(max_total))
+
+        self._sessions: Dict[str, "OrderedDict[str, HistoryEntry]"] = {}
+        self._order: "OrderedDict[Tuple[str, str], None]" = OrderedDict()  # 全局插入顺序
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add(self, session_id: str, entry: HistoryEntry) -> None:
+        if not entry.mid:
+            return
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = OrderedDict()
+            self._sessions[session_id] = session
+        session[entry.mid] = entry
+        session.move_to_end(entry.mid)
+        self._order[(session_id, entry.mid)] = None
+        self._order.move_to_end((session_id, entry.mid))
+        while len(session) > self.max_per_session:
+            old_mid, _ = session.popitem(last=False)
+            self._order.pop((session_id, old_mid), None)
+            self.evictions += 1
+        while len(self._order) > self.max_total:
+            (old_session_id, old_mid), _ = self._order.popitem(last=False)
+            self._remove(old_session_id, old_mid)
+            self.evictions += 1
+
+    def _remove(self, session_id: str, mid: str) -> None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.pop(mid, None)
+        if not session:
+            del self._sessions[session_id]
+
+    def get(self, session_id: str, mid: str) -> Optional[HistoryEntry]:
+        session = self._sessions.get(session_id)
+        entry = session.get(mid) if session else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "entries": len(self._order),
+            "max_per_session": self.max_per_session,
+            "max_total": self.max_total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
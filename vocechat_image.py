@@ -0,0 +1,176 @@
+# vocechat_image.py
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image as PILImage, ImageOps
+except ImportError:  # Pillow 为可选依赖，未安装时不做预处理
+    PILImage = None
+    ImageOps = None
+
+from astrbot import logger
+
+from .vocechat_attachment import AttachmentStore
+
+_FORMATS = {"jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+
+
+def _transform_image(src_path: str, dst_path: str, max_edge: int, pil_format: str, quality: int) -> Tuple[int, int]:
+    """在子进程中执行：解码、按最长边缩放并重新压缩。
+
+    Returns:
+        Tuple[int, int]: (原文件字节数, 输出文件字节数)；无需处理（如动图）时输出字节数为 -1
+    """
+    src_size = os.path.getsize(src_path)
+    with PILImage.open(src_path) as im:
+        if getattr(im, "n_frames", 1) > 1:
+            return src_size, -1  # 动图保持原样
+        im.draft("RGB", (max_edge, max_edge))  # JPEG 可以直接以较低分辨率解码
+        im = ImageOps.exif_transpose(im)
+        if max(im.size) > max_edge:
+            im.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
+        if pil_format == "JPEG" and im.mode not in ("RGB", "L"):
+            if im.mode in ("RGBA", "LA", "P"):
+                im = im.convert("RGBA")
+                background = PILImage.new("RGB", im.size, (255, 255, 255))
+                background.paste(im, mask=im.getchannel("A"))
+                im = background
+            else:
+                im = im.convert("RGB")
+        tmp_path = f"{dst_path}.part.{uuid.uuid4().hex[:8]}"
+        try:
+            im.save(tmp_path, format=pil_format, quality=quality, optimize=True)
+            os.replace(tmp_path, dst_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    return src_size, os.path.getsize(dst_path)
+
+
+class ImagePreprocessor:
+    """在进程池中缩放并重新压缩图片，减少交给 LLM 的图片体积。
+
+    结果按 VoceChat file_path 与转换参数缓存在附件缓存目录中（参与同一个 LRU 淘汰）；
+    处理后反而更大或无需处理的图片直接使用原文件。未安装 Pillow 时 available 为 False。
+    """
+
+    def __init__(
+        self,
+        store: AttachmentStore,
+        max_edge: int = 1568,
+        output_format: str = "jpeg",
+        quality: int = 85,
+        max_workers: int = 2,
+        name: str = "",
+    ) -> None:
+        self.store = store
+        self.max_edge = max(64, int(max_edge))
+        output_format = output_format.lower()
+        if output_format not in _FORMATS:
+            logger.warning(f"ImagePreprocessor '{name}': 不支持的图片格式 '{output_format}'，使用 'jpeg'。")
+            output_format = "jpeg"
+        self.output_format = output_format
+        self.quality = min(100, max(1, int(quality)))
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._passthrough: Dict[str, None] = {}  # 无需处理的图片，避免重复尝试
+
+        self.processed = 0
+        self.cache_hits = 0
+        self.passthrough = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def available(self) -> bool:
+        return PILImage is not None
+
+    def _cache_name(self, file_path: str) -> str:
+        key = f"{file_path}|{self.max_edge}|{self.output_format}|{self.quality}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + _FORMATS[self.output_format][1]
+
+    async def process(self, source_path: str, file_path: str, display_name: str = "") -> str:
+        """返回处理后的图片路径；处理失败或无需处理时返回 source_path"""
+        if not self.available:
+            return source_path
+        cache_name = self._cache_name(file_path)
+        if cache_name in self._passthrough:
+            return source_path
+        cached = self.store.cached_path(cache_name)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        fut = self._inflight.get(cache_name)
+        if fut is None:
+            fut = asyncio.ensure_future(self._run(source_path, cache_name, display_name or file_path))
+            self._inflight[cache_name] = fut
+            fut.add_done_callback(lambda _f, k=cache_name: self._inflight.pop(k, None))
+        return await asyncio.shield(fut)
+
+    async def _run(self, source_path: str, cache_name: str, display_name: str) -> str:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        dst_path = os.path.join(self.store.cache_dir, cache_name)
+        loop = asyncio.get_running_loop()
+        try:
+            src_size, out_size = await loop.run_in_executor(
+                self._executor, _transform_image, source_path, dst_path, self.max_edge, _FORMATS[self.output_format][0], self.quality
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"ImagePreprocessor '{self.name}': 预处理图片 '{display_name}' 失败，使用原图: {e}")
+            return source_path
+
+        if out_size < 0 or out_size >= src_size:
+            if out_size >= 0:
+                try:
+                    os.remove(dst_path)
+                except OSError:
+                    pass
+            self.passthrough += 1
+            self._passthrough[cache_name] = None
+            if len(self._passthrough) > 10000:
+                self._passthrough.pop(next(iter(self._passthrough)))
+            logger.debug(f"ImagePreprocessor '{self.name}': 图片 '{display_name}' 无需预处理，使用原图 ({src_size} 字节)。")
+            return source_path
+
+        self.processed += 1
+        self.bytes_in += src_size
+        self.bytes_out += out_size
+        self.store.add_file(cache_name, out_size)
+        logger.info(
+            f"ImagePreprocessor '{self.name}': 图片 '{display_name}' {src_size} -> {out_size} 字节，"
+            f"节省 {src_size - out_size} 字节 ({(1 - out_size / src_size) * 100:.1f}%)"
+        )
+        return dst_path
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "max_edge": self.max_edge,
+            "format": self.output_format,
+            "quality": self.quality,
+            "processed": self.processed,
+            "cache_hits": self.cache_hits,
+            "passthrough": self.passthrough,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
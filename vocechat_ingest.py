@@ -0,0 +1,183 @@
+# vocechat_ingest.py
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from astrbot import logger
+
+
+class WebhookIngestPool:
+    """Webhook 异步处理池。
+
+    Webhook 请求在解析出 JSON 后立即入队并返回 200，由固定数量的 worker 在后台
+    执行 convert_message 与 commit_event。每个会话拥有独立的待处理队列，同一时刻最多由一个 worker 处理，
+    从而保证会话内的处理顺序；有待处理消息的会话排队等待任意空闲的 worker，
+    某个会话处理缓慢（下载附件、查询昵称）不会阻塞其他会话。
+    """
+
+    OVERFLOW_POLICIES = ("reject", "block")
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        worker_count: int = 4,
+        queue_size: int = 1000,
+        overflow_policy: str = "reject",
+        put_timeout: float = 1.0,
+        name: str = "",
+    ) -> None:
+        """
+        Args:
+            handler: 处理单条 Webhook 数据的协程函数
+            worker_count: worker 数量
+            queue_size: 所有会话待处理消息的总容量
+            overflow_policy: 队列已满时的策略，"reject" 立即拒绝，"block" 最多等待 put_timeout 秒
+            put_timeout: "block" 策略下入队的最长等待时间（秒）
+            name: 日志中使用的实例名
+        """
+        self._handler = handler
+        self.worker_count = max(1, int(worker_count))
+        self.queue_size = max(self.worker_count, int(queue_size))
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            logger.warning(f"WebhookIngestPool '{name}': 未知的溢出策略 '{overflow_policy}'，使用 'reject'。")
+            overflow_policy = "reject"
+        self.overflow_policy = overflow_policy
+        self.put_timeout = float(put_timeout)
+        self.name = name
+
+        self._sessions: Dict[str, Deque[Any]] = {}
+        self._scheduled: Set[str] = set()  # 已在 _ready 中排队或正在处理的会话
+        self._ready: Optional[asyncio.Queue] = None
+        self._space_freed: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._pending = 0  # 已入队、尚未处理完的消息数
+        self._workers: List[asyncio.Task] = []
+        self._busy = [False] * self.worker_count
+        self._busy_seconds = [0.0] * self.worker_count
+        self._started_at: Optional[float] = None
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.overflowed = 0
+
+    def _ensure_primitives(self) -> None:
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._space_freed = asyncio.Event()
+            self._drained = asyncio.Event()
+            self._drained.set()
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._ensure_primitives()
+        self._started_at = time.monotonic()
+        self._workers = [asyncio.create_task(self._worker_loop(i)) for i in range(self.worker_count)]
+        logger.info(f"WebhookIngestPool '{self.name}': 已启动 {self.worker_count} 个 worker，队列容量 {self.queue_size}，溢出策略 {self.overflow_policy}。")
+
+    async def submit(self, session_key: str, item: Any) -> bool:
+        """将一条 Webhook 数据放入对应会话的队列。
+
+        Returns:
+            bool: 是否成功入队；返回 False 表示队列已满（已计入 overflowed）
+        """
+        self._ensure_primitives()
+        if self._pending >= self.queue_size:
+            if self.overflow_policy != "block" or not await self._wait_for_space():
+                self.overflowed += 1
+                return False
+        self._pending += 1
+        self._drained.clear()
+        self._sessions.setdefault(session_key, deque()).append(item)
+        if session_key not in self._scheduled:
+            self._scheduled.add(session_key)
+            self._ready.put_nowait(session_key)
+        self.enqueued += 1
+        return True
+
+    async def _wait_for_space(self) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.put_timeout
+        while self._pending >= self.queue_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            self._space_freed.clear()
+            try:
+                await asyncio.wait_for(self._space_freed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def _release(self) -> None:
+        self._pending -= 1
+        if self._pending == 0:
+            self._drained.set()
+        self._space_freed.set()
+
+    async def _worker_loop(self, index: int) -> None:
+        while True:
+            session_key = await self._ready.get()
+            items = self._sessions[session_key]
+            item = items.popleft()
+            self._busy[index] = True
+            started = time.monotonic()
+            try:
+                await self._handler(item)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"WebhookIngestPool '{self.name}': worker#{index} 处理 Webhook 数据失败: {e}", exc_info=True)
+            finally:
+                self._busy_seconds[index] += time.monotonic() - started
+                self._busy[index] = False
+                # 会话还有待处理的消息时排到队尾，让其他会话先获得 worker
+                if items:
+                    self._ready.put_nowait(session_key)
+                else:
+                    self._sessions.pop(session_key, None)
+                    self._scheduled.discard(session_key)
+                self._release()
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """停止所有 worker，先在 drain_timeout 内尽量处理完已入队的数据。"""
+        if not self._workers:
+            return
+        pending = self.queue_depth()
+        if pending:
+            logger.info(f"WebhookIngestPool '{self.name}': 正在处理剩余的 {pending} 条 Webhook 数据（最多 {drain_timeout} 秒）...")
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"WebhookIngestPool '{self.name}': 排空超时，丢弃剩余的 {self.queue_depth()} 条数据。")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._sessions.clear()
+        self._scheduled.clear()
+        self._ready = None
+        self._pending = 0
+
+    def queue_depth(self) -> int:
+        return sum(len(items) for items in self._sessions.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        total_busy = sum(self._busy_seconds)
+        return {
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self.queue_size,
+            "workers": self.worker_count,
+            "busy_workers": sum(self._busy),
+            "pending_sessions": len(self._sessions),
+            "worker_utilisation": (total_busy / (uptime * self.worker_count)) if uptime > 0 else 0.0,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "overflowed": self.overflowed,
+        }
@@ -0,0 +1,191 @@
+# vocechat_listener.py
+import asyncio
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from astrbot import logger
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+RouteKey = Tuple[str, str]  # (HTTP 方法, 路径)
+Address = Tuple[str, int]
+
+
+class RouteConflictError(ValueError):
+    """路径已被另一个适配器实例占用"""
+
+
+class _Route:
+    __slots__ = ("handler", "owner", "token")
+
+    def __init__(self, handler: Handler, owner: str, token: object) -> None:
+        self.handler = handler
+        self.owner = owner  # 平台实例 ID，相同 ID 的新实例可以接管路径
+        self.token = token  # 注册者对象，注销时只移除自己注册的路由
+
+
+class _Listener:
+    """一个 (host, port) 上的共享 aiohttp 服务器，按请求路径分发给已注册的处理函数"""
+
+    def __init__(self, address: Address, reuse_port: bool) -> None:
+        self.address = address
+        self.reuse_port = reuse_port
+        self.routes: Dict[RouteKey, _Route] = {}
+        self.loop = asyncio.get_running_loop()
+        self.runner: Optional[web.AppRunner] = None
+        self.close_task: Optional[asyncio.Task] = None
+        self.requests = 0
+        self.not_found = 0
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._dispatch)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        host, port = self.address
+        site = web.TCPSite(self.runner, host, port, reuse_address=True, reuse_port=self.reuse_port)
+        try:
+            await site.start()
+        except BaseException:
+            await self.runner.cleanup()
+            self.runner = None
+            raise
+
+    async def close(self) -> None:
+        if self.runner is not None:
+            await asyncio.wait_for(self.runner.cleanup(), timeout=5.0)
+            self.runner = None
+
+    async def _dispatch(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        route = self.routes.get((request.method, request.path))
+        if route is None and request.method == "HEAD":
+            route = self.routes.get(("GET", request.path))
+        if route is None:
+            self.not_found += 1
+            return web.Response(text="Not Found", status=404)
+        return await route.handler(request)
+
+
+class WebhookListenerRegistry:
+    """进程级的 Webhook 监听注册表。
+
+    多个适配器实例可以共用同一个 host:port，按路径分发请求。实例停用时只注销自己的路由，
+    最后一个路由注销后监听端口还会保留 linger 秒，期间重新启用无需重新绑定端口。
+    """
+
+    def __init__(self) -> None:
+        self._listeners: Dict[Address, _Listener] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            # 事件循环已更换（例如 AstrBot 重启了循环）：旧循环上的监听与绑定在旧循环上的锁都不可再用
+            self._listeners = {address: listener for address, listener in self._listeners.items() if listener.loop is loop}
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def is_listening(self, host: str, port: int) -> bool:
+        listener = self._listeners.get((host, port))
+        return listener is not None and listener.runner is not None
+
+    async def register(
+        self,
+        host: str,
+        port: int,
+        routes: Dict[RouteKey, Handler],
+        owner: str,
+        token: object,
+        reuse_port: bool = False,
+    ) -> None:
+        """注册路由，必要时在 host:port 上启动监听
+
+        Raises:
+            RouteConflictError: 路径已被另一个平台实例占用
+            OSError: 绑定端口失败
+        """
+        async with self._get_lock():
+            address = (host, port)
+            listener = self._listeners.get(address)
+            for key in routes:
+                existing = listener.routes.get(key) if listener else None
+                if existing is not None and existing.owner != owner:
+                    raise RouteConflictError(f"{key[0]} {key[1]} 已被平台实例 '{existing.owner}' 占用")
+            if listener is None:
+                listener = _Listener(address, reuse_port=reuse_port and hasattr(socket, "SO_REUSEPORT"))
+                await listener.start()
+                self._listeners[address] = listener
+                logger.info(f"WebhookListenerRegistry: 已在 {host}:{port} 启动共享 Webhook 监听。")
+            if listener.close_task is not None:
+                listener.close_task.cancel()
+                listener.close_task = None
+            for key, handler in routes.items():
+                listener.routes[key] = _Route(handler, owner, token)
+            logger.info(f"WebhookListenerRegistry: 平台实例 '{owner}' 已在 {host}:{port} 注册 {', '.join(f'{m} {p}' for m, p in routes)}。")
+
+    async def unregister(self, host: str, port: int, token: object, linger: float = 30.0) -> None:
+        """注销 token 注册的全部路由。监听上没有路由后，在 linger 秒后关闭端口（linger <= 0 时立即关闭）"""
+        async with self._get_lock():
+            address = (host, port)
+            listener = self._listeners.get(address)
+            if listener is None:
+                return
+            for key in [k for k, route in listener.routes.items() if route.token is token]:
+                del listener.routes[key]
+            if listener.routes or listener.close_task is not None:
+                return
+            if linger <= 0:
+                self._listeners.pop(address, None)
+            else:
+                listener.close_task = asyncio.create_task(self._close_later(listener, linger))
+                return
+        await self._close_listener(listener)
+
+    async def _close_later(self, listener: _Listener, delay: float) -> None:
+        await asyncio.sleep(delay)
+        async with self._get_lock():
+            if listener.routes or self._listeners.get(listener.address) is not listener:
+                return
+            self._listeners.pop(listener.address, None)
+            listener.close_task = None
+        await self._close_listener(listener)
+
+    async def _close_listener(self, listener: _Listener) -> None:
+        host, port = listener.address
+        try:
+            await listener.close()
+            logger.info(f"WebhookListenerRegistry: 已关闭 {host}:{port} 上的 Webhook 监听。")
+        except asyncio.TimeoutError:
+            logger.warning(f"WebhookListenerRegistry: 关闭 {host}:{port} 上的监听超时（5秒），强制继续")
+        except Exception as e:
+            logger.error(f"WebhookListenerRegistry: 关闭 {host}:{port} 上的监听时出错: {e}", exc_info=True)
+
+    async def close_all(self) -> None:
+        """立即关闭全部监听"""
+        async with self._get_lock():
+            listeners = list(self._listeners.values())
+            self._listeners.clear()
+        for listener in listeners:
+            if listener.close_task is not None:
+                listener.close_task.cancel()
+            await self._close_listener(listener)
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "address": f"{host}:{port}",
+                "routes": sorted(f"{m} {p} -> {route.owner}" for (m, p), route in listener.routes.items()),
+                "lingering": listener.close_task is not None,
+                "requests": listener.requests,
+                "not_found": listener.not_found,
+            }
+            for (host, port), listener in self._listeners.items()
+        ]
+
+
+# 进程内唯一的注册表，供所有 VoceChatAdapter 实例共享
+listener_registry = WebhookListenerRegistry()
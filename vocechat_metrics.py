@@ -0,0 +1,152 @@
+# vocechat_metrics.py
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# 默认的延迟分桶（秒），覆盖从毫秒级的 JSON 解析到十几秒的超时
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LabelKey = Tuple[str, ...]
+GaugeValue = Union[float, int, Iterable[Tuple[Dict[str, str], float]]]
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(str(v))}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> _LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self, const_labels: Sequence[Tuple[str, str]]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[_LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self, const_labels: Sequence[Tuple[str, str]]) -> List[str]:
+        lines = []
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels([*const_labels, *zip(self.labelnames, key)])} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各分桶计数..., 总和, 总数]
+        self._series: Dict[_LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = [0.0] * (len(self.buckets) + 2)
+            self._series[key] = series
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self, const_labels: Sequence[Tuple[str, str]]) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            base = [*const_labels, *zip(self.labelnames, key)]
+            cumulative = 0.0
+            for upper, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels([*base, ('le', _format_value(upper))])} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels([*base, ('le', '+Inf')])} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {_format_value(series[-1])}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """在抓取时通过回调读取当前值的 Gauge"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], GaugeValue]) -> None:
+        super().__init__(name, help_text)
+        self._callback = callback
+
+    def render(self, const_labels: Sequence[Tuple[str, str]]) -> List[str]:
+        value = self._callback()
+        if isinstance(value, (int, float)):
+            return [f"{self.name}{_format_labels(const_labels)} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels([*const_labels, *labels.items()])} {_format_value(v)}" for labels, v in value]
+
+
+class MetricsRegistry:
+    """极简的 Prometheus 文本格式指标注册表（不依赖 prometheus_client）"""
+
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None) -> None:
+        self.const_labels = tuple((const_labels or {}).items())
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], GaugeValue]) -> GaugeCallback:
+        metric = GaugeCallback(name, help_text, callback)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(self.const_labels))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,272 @@
+# vocechat_outbox.py
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from astrbot import logger
+
+# 入队的一条记录: (kind, content_type, body, filename)
+OutboxRow = Tuple[str, str, bytes, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target_key TEXT NOT NULL,
+    target_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    filename TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS outbox_target ON outbox (target_key, id);
+"""
+
+# 同一目标中更早的消息还在退避时，后面的消息也不能先发，保证顺序
+_SELECT_DUE = """
+SELECT id, target_key, target_id, kind, content_type, body, filename, created_at, attempts FROM outbox AS o
+WHERE (? OR o.next_attempt_at <= ?)
+  AND NOT EXISTS (SELECT 1 FROM outbox AS e WHERE e.target_key = o.target_key AND e.id < o.id AND NOT ? AND e.next_attempt_at > ?)
+ORDER BY o.id LIMIT ?
+"""
+
+
+class OutboxPermanentError(Exception):
+    """消息无法投递且重试没有意义（例如待上传的文件已被删除），直接丢弃"""
+
+
+class OutboxItem:
+    __slots__ = ("id", "target_key", "target_id", "kind", "content_type", "body", "filename", "created_at", "attempts")
+
+    def __init__(self, row: Sequence[Any]) -> None:
+        (self.id, self.target_key, self.target_id, self.kind, self.content_type,
+         self.body, self.filename, self.created_at, self.attempts) = row
+
+
+class SendOutbox:
+    """基于 SQLite (WAL) 的持久化发件箱。
+
+    send_by_session 只需把消息写入发件箱即可返回；后台任务按批次投递，同一目标内按入队顺序发送，
+    失败时按指数退避重试。超过 max_attempts 次或入队超过 max_age 秒的消息会被丢弃并计数。
+    适配器关闭时在截止时间内尽量投递剩余消息，未投递的消息保留在磁盘上，下次启动继续投递。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        deliver: Callable[[OutboxItem], Awaitable[None]],
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_attempts: int = 20,
+        max_age: float = 86400.0,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        name: str = "",
+    ) -> None:
+        self.path = path
+        self._deliver = deliver
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.05, float(flush_interval))
+        self.max_attempts = max(1, int(max_attempts))
+        self.max_age = float(max_age)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.name = name
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+        self._depth = 0
+        self._oldest_created_at: Optional[float] = None
+        self.enqueued = 0
+        self.delivered = 0
+        self.retries = 0
+        self.dropped_expired = 0
+        self.dropped_attempts = 0
+        self.dropped_failed = 0
+
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        self._refresh_counts()
+        if self._depth:
+            logger.info(f"SendOutbox '{self.name}': 发件箱中有 {self._depth} 条上次未投递的消息。")
+
+    def _execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        with self._db_lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Any]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _refresh_counts(self) -> None:
+        with self._db_lock:
+            count, oldest = self._conn.execute("SELECT COUNT(*), MIN(created_at) FROM outbox").fetchone()
+        self._depth = count
+        self._oldest_created_at = oldest
+
+    def start(self) -> None:
+        self._open()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, target_key: str, target_id: str, rows: List[OutboxRow]) -> None:
+        """把一条消息链（按组件拆分的多行）写入发件箱"""
+        if not rows:
+            return
+        if self._conn is None:
+            await asyncio.to_thread(self._open)
+        now = time.time()
+
+        def _insert() -> None:
+            with self._db_lock:
+                with self._conn:  # 单个事务，整条消息链要么全部入队要么全部失败
+                    self._conn.execute("BEGIN")
+                    self._conn.executemany(
+                        "INSERT INTO outbox (target_key, target_id, kind, content_type, body, filename, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(target_key, target_id, kind, content_type, body, filename, now, now) for kind, content_type, body, filename in rows],
+                    )
+
+        await asyncio.to_thread(_insert)
+        self.enqueued += len(rows)
+        self._depth += len(rows)
+        if self._oldest_created_at is None:
+            self._oldest_created_at = now
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return  # Python 3.12 之前，取消时 wakeup 恰好已被设置的话 wait_for 会吞掉取消请求
+            self._wakeup.clear()
+            try:
+                while await self.flush_once() >= self.batch_size:
+                    pass  # 积压较多时连续投递，直到取到的批次不满
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SendOutbox '{self.name}': 投递批次失败: {e}", exc_info=True)
+
+    async def flush_once(self, ignore_backoff: bool = False) -> int:
+        """投递一批到期的消息，返回本批处理的条数"""
+        if self._conn is None or self._depth == 0:
+            return 0
+        now = time.time()
+        if self.max_age > 0:
+            expired = await asyncio.to_thread(self._execute, "DELETE FROM outbox WHERE created_at < ?", (now - self.max_age,))
+            if expired:
+                self.dropped_expired += expired
+                self._depth = max(0, self._depth - expired)
+                logger.warning(f"SendOutbox '{self.name}': {expired} 条消息超过 {self.max_age:.0f} 秒未能投递，已丢弃。")
+        rows = await asyncio.to_thread(self._fetchall, _SELECT_DUE, (ignore_backoff, now, ignore_backoff, now, self.batch_size))
+        by_target: Dict[str, List[OutboxItem]] = {}
+        for row in rows:
+            item = OutboxItem(row)
+            by_target.setdefault(item.target_key, []).append(item)
+        if by_target:
+            await asyncio.gather(*(self._deliver_target(items) for items in by_target.values()))
+        await asyncio.to_thread(self._refresh_counts)
+        return len(rows)
+
+    async def _deliver_target(self, items: List[OutboxItem]) -> None:
+        for item in items:
+            try:
+                await self._deliver(item)
+            except OutboxPermanentError as e:
+                self.dropped_failed += 1
+                logger.error(f"SendOutbox '{self.name}': 消息 #{item.id} 无法投递到 {item.target_id}，已丢弃: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempts = item.attempts + 1
+                if attempts >= self.max_attempts:
+                    self.dropped_attempts += 1
+                    logger.error(f"SendOutbox '{self.name}': 消息 #{item.id} 投递到 {item.target_id} 失败 {attempts} 次，已丢弃: {e}")
+                else:
+                    self.retries += 1
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** item.attempts)) * random.uniform(0.5, 1.5)
+                    await asyncio.to_thread(
+                        self._execute,
+                        "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, time.time() + delay, f"{type(e).__name__}: {e}"[:500], item.id),
+                    )
+                    logger.warning(f"SendOutbox '{self.name}': 消息 #{item.id} 投递到 {item.target_id} 失败 ({type(e).__name__}: {e})，{delay:.1f} 秒后第 {attempts} 次重试。")
+                    return  # 同一目标后面的消息等这条成功后再发
+            else:
+                self.delivered += 1
+            await asyncio.to_thread(self._execute, "DELETE FROM outbox WHERE id = ?", (item.id,))
+            self._depth = max(0, self._depth - 1)
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """停止后台投递，并在 drain_timeout 内尽量投递剩余消息（忽略退避时间）"""
+        task, self._task = self._task, None
+        if task is not None:
+            self._stopping = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._conn is None:
+            return
+        if self._depth:
+            logger.info(f"SendOutbox '{self.name}': 投递发件箱中剩余的 {self._depth} 条消息（最多 {drain_timeout} 秒）...")
+            deadline = time.monotonic() + drain_timeout
+
+            async def _drain() -> None:
+                while self._depth:
+                    before = self._depth
+                    await self.flush_once(ignore_backoff=True)
+                    if self._depth >= before:
+                        break  # 一轮下来没有进展（服务器仍不可用）
+
+            try:
+                await asyncio.wait_for(_drain(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            if self._depth:
+                logger.warning(f"SendOutbox '{self.name}': 仍有 {self._depth} 条消息未投递，将保留在 {self.path} 中，下次启动后继续投递。")
+        with self._db_lock:
+            self._conn.close()
+            self._conn = None
+
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def oldest_age(self) -> float:
+        """最早一条未投递消息的等待时间（秒），发件箱为空时为 0"""
+        return (time.time() - self._oldest_created_at) if self._oldest_created_at is not None and self._depth else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._depth,
+            "oldest_age": self.oldest_age(),
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "retries": self.retries,
+            "dropped_expired": self.dropped_expired,
+            "dropped_attempts": self.dropped_attempts,
+            "dropped_failed": self.dropped_failed,
+        }
@@ -0,0 +1,190 @@
+# vocechat_payload.py
+"""VoceChat Webhook 数据的解码与校验。
+
+请求体直接从字节解码为带 __slots__ 的轻量对象，后续处理不再反复对原始 dict 做 .get() 与类型判断。
+安装了 orjson 时使用 orjson 解析 JSON，否则回退到标准库 json。
+"""
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+
+    def _loads(body: bytes) -> Any:
+        return orjson.loads(body)
+except ImportError:  # orjson 为可选依赖
+    def _loads(body: bytes) -> Any:
+        return json.loads(body)
+
+
+class PayloadError(ValueError):
+    """Webhook 数据不是合法的 JSON，或结构不符合 VoceChat 的格式"""
+
+
+def _opt_str(value: Any) -> str:
+    """None / 0 / 空值统一为空字符串，其余转为字符串"""
+    return str(value) if value else ""
+
+
+class WebhookTarget:
+    __slots__ = ("gid", "uid")
+
+    def __init__(self, gid: Optional[str], uid: Optional[str]) -> None:
+        self.gid = gid
+        self.uid = uid
+
+
+class WebhookFile:
+    """vocechat/file 消息中的文件信息"""
+
+    __slots__ = ("path", "name", "content_type", "size")
+
+    def __init__(self, path: str, name: str, content_type: str, size: Optional[int]) -> None:
+        self.path = path
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+
+
+class WebhookDetail:
+    __slots__ = ("type", "content_type", "content", "properties", "file", "new_user_uid", "new_user_name", "reply_mid")
+
+    def __init__(self) -> None:
+        self.type = ""
+        self.content_type = "text/plain"
+        self.content: Any = ""
+        self.properties: Optional[Dict[str, Any]] = None
+        self.file: Optional[WebhookFile] = None
+        self.new_user_uid = ""
+        self.new_user_name = ""
+        self.reply_mid = ""  # 回复消息所引用的 mid
+
+    @property
+    def is_new_user_event(self) -> bool:
+        return isinstance(self.content, str) and self.content.strip().lower() == "newuser"
+
+
+class WebhookPayload:
+    __slots__ = ("mid", "from_uid", "created_at", "target", "detail", "raw", "trace")
+
+    def __init__(self, mid: str, from_uid: str, created_at: Any, target: WebhookTarget, detail: WebhookDetail, raw: Dict[str, Any]) -> None:
+        self.mid = mid
+        self.from_uid = from_uid
+        self.created_at = created_at
+        self.target = target
+        self.detail = detail
+        self.raw = raw
+        self.trace: Any = None  # 被抽样追踪时为 vocechat_trace.Trace
+
+    @property
+    def session_key(self) -> str:
+        """会话键，用于保证同一会话内消息的处理顺序"""
+        if self.target.gid is not None:
+            return f"group:{self.target.gid}"
+        return f"user:{self.from_uid}"
+
+    @property
+    def dedupe_key(self) -> str:
+        """用于去重的稳定消息键：优先使用 mid；newuser 事件没有 mid 时由群、用户与 created_at 组成。
+
+        无法确定时返回空字符串，由调用方自行回退（例如使用请求体哈希）。
+        """
+        if self.mid:
+            return f"mid:{self.mid}"
+        if self.detail.is_new_user_event and self.detail.new_user_uid:
+            return f"newuser:{self.target.gid or ''}:{self.detail.new_user_uid}:{self.created_at or ''}"
+        return ""
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "WebhookPayload":
+        """校验并转换已解析的 Webhook dict
+
+        Raises:
+            PayloadError: 结构不符合 VoceChat Webhook 格式
+        """
+        if not isinstance(data, dict):
+            raise PayloadError(f"Webhook 数据应为 JSON 对象，实际为 {type(data).__name__}")
+
+        raw_target = data.get("target") or {}
+        if not isinstance(raw_target, dict):
+            raise PayloadError("target 字段应为对象")
+        gid = raw_target.get("gid")
+        uid = raw_target.get("uid")
+        target = WebhookTarget(str(gid) if gid is not None else None, str(uid) if uid is not None else None)
+
+        raw_detail = data.get("detail") or {}
+        if not isinstance(raw_detail, dict):
+            raise PayloadError("detail 字段应为对象")
+        detail = WebhookDetail()
+        detail.type = str(raw_detail.get("type") or "")
+        detail.content_type = str(raw_detail.get("content_type") or "text/plain")
+        detail.content = raw_detail.get("content", "")
+        properties = raw_detail.get("properties")
+        detail.properties = properties if isinstance(properties, dict) else None
+        # VoceChat 的回复消息: detail.type 为 "reply"，detail.mid 为被引用的消息
+        if detail.type == "reply":
+            detail.reply_mid = _opt_str(raw_detail.get("mid"))
+        elif detail.properties:
+            detail.reply_mid = _opt_str(detail.properties.get("reply_mid"))
+
+        from_uid = _opt_str(data.get("from_uid"))
+        if detail.is_new_user_event:
+            detail.new_user_uid = from_uid
+            detail.new_user_name = f"NewUser_{from_uid}"
+            user_info = detail.properties.get("user") if detail.properties else None
+            if from_uid in ("", "0") and isinstance(user_info, dict) and "uid" in user_info:
+                detail.new_user_uid = str(user_info["uid"])
+                detail.new_user_name = user_info.get("name", f"NewUser_{detail.new_user_uid}")
+        elif detail.content_type == "vocechat/file":
+            detail.file = _decode_file(detail.content, detail.properties)
+
+        return cls(
+            mid=_opt_str(data.get("mid")),
+            from_uid=from_uid,
+            created_at=data.get("created_at"),
+            target=target,
+            detail=detail,
+            raw=data,
+        )
+
+
+def _decode_file(content: Any, properties: Optional[Dict[str, Any]]) -> WebhookFile:
+    path = content if isinstance(content, str) else ""
+    name = "file"
+    content_type = "application/octet-stream"
+    size: Any = None
+    if properties:
+        files = properties.get("files")
+        if isinstance(files, list) and files and isinstance(files[0], dict):
+            file_info = files[0]
+            name = file_info.get("name", name)
+            content_type = file_info.get("content_type", content_type)
+            size = file_info.get("size")
+            if not path and isinstance(file_info.get("path"), str):
+                path = file_info["path"]
+        else:
+            name = properties.get("name", name)
+            content_type = properties.get("content_type", content_type)
+            size = properties.get("size")
+    return WebhookFile(path=path, name=str(name), content_type=str(content_type), size=size if isinstance(size, int) else None)
+
+
+def decode_json(body: bytes) -> Any:
+    """解析 JSON 字节
+
+    Raises:
+        PayloadError: 不是合法的 JSON
+    """
+    try:
+        return _loads(body)
+    except ValueError as e:  # json.JSONDecodeError 与 orjson.JSONDecodeError 均继承自 ValueError
+        raise PayloadError(f"无效的 JSON: {e}") from e
+
+
+def decode_webhook(body: bytes) -> WebhookPayload:
+    """从请求体字节解码 Webhook 数据
+
+    Raises:
+        PayloadError: 不是合法的 JSON 或结构不符合格式
+    """
+    return WebhookPayload.from_dict(decode_json(body))
@@ -0,0 +1,166 @@
+# vocechat_stream.py
+import asyncio
+import random
+import time
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from astrbot import logger
+
+# (事件类型, 事件 id, data)
+StreamEvent = Tuple[str, Optional[str], bytes]
+
+
+class StreamError(Exception):
+    """事件流连接返回了非 200 响应"""
+
+
+class SSEParser:
+    """按行增量解析 text/event-stream"""
+
+    def __init__(self) -> None:
+        self._data: List[bytes] = []
+        self._event = ""
+        self._id: Optional[str] = None
+
+    def feed_line(self, line: bytes) -> Optional[StreamEvent]:
+        """输入一行，遇到空行（事件结束）时返回完整事件"""
+        line = line.rstrip(b"\r\n")
+        if not line:
+            if not self._data:
+                self._event = ""
+                return None
+            event = (self._event or "message", self._id, b"\n".join(self._data))
+            self._data = []
+            self._event = ""
+            return event
+        if line.startswith(b":"):  # 注释，通常用作保活
+            return None
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8", errors="replace")
+        elif field == b"id":
+            self._id = value.decode("utf-8", errors="replace")
+        return None
+
+
+class EventStreamClient:
+    """保持一条到 VoceChat 的长连接事件流，断线后自动重连并从最后处理的事件继续。
+
+    - opener(last_event_id) 返回一个异步上下文管理器，产出流式 HTTP 响应。
+    - handler(event_type, event_id, data) 处理单个事件，返回值（如消息 mid）作为续传位置；
+      返回 None 时使用事件自带的 id。
+    - 超过 heartbeat_timeout 秒没有收到任何数据（包括心跳）视为连接失效并重连。
+    - 重连间隔从 reconnect_min 开始按指数增长到 reconnect_max，连接成功后重置。
+    """
+
+    def __init__(
+        self,
+        opener: Callable[[Optional[str]], AsyncContextManager[aiohttp.ClientResponse]],
+        handler: Callable[[str, Optional[str], bytes], Awaitable[Optional[str]]],
+        heartbeat_timeout: float = 60.0,
+        reconnect_min: float = 1.0,
+        reconnect_max: float = 30.0,
+        name: str = "",
+    ) -> None:
+        self._opener = opener
+        self._handler = handler
+        self.heartbeat_timeout = max(1.0, float(heartbeat_timeout))
+        self.reconnect_min = max(0.01, float(reconnect_min))
+        self.reconnect_max = max(self.reconnect_min, float(reconnect_max))
+        self.name = name
+
+        self.last_event_id: Optional[str] = None
+        self.connected = False
+        self._task: Optional[asyncio.Task] = None
+        self._last_activity = 0.0
+
+        self.connects = 0
+        self.reconnects = 0
+        self.events = 0
+        self.heartbeat_timeouts = 0
+        self.failures = 0
+        self.handler_failures = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"EventStreamClient '{self.name}': 事件流任务异常退出: {e}", exc_info=True)
+
+    async def _run(self) -> None:
+        delay = self.reconnect_min
+        while True:
+            try:
+                async with self._opener(self.last_event_id) as resp:
+                    if resp.status != 200:
+                        body = await resp.text()
+                        raise StreamError(f"HTTP {resp.status}: {body[:200]}")
+                    self.connects += 1
+                    self.connected = True
+                    delay = self.reconnect_min
+                    logger.info(f"EventStreamClient '{self.name}': 事件流已连接 (续传位置: {self.last_event_id})")
+                    await self._consume(resp)
+                logger.warning(f"EventStreamClient '{self.name}': 事件流被服务器关闭，准备重连。")
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self.heartbeat_timeouts += 1
+                logger.warning(f"EventStreamClient '{self.name}': {self.heartbeat_timeout:.0f} 秒内未收到数据或心跳，准备重连。")
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"EventStreamClient '{self.name}': 事件流连接失败: {e}，{delay:.1f} 秒后重连。")
+            finally:
+                self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(self.reconnect_max, delay * 2)
+
+    async def _consume(self, resp: aiohttp.ClientResponse) -> None:
+        parser = SSEParser()
+        while True:
+            line = await asyncio.wait_for(resp.content.readline(), timeout=self.heartbeat_timeout)
+            if not line:
+                return
+            self._last_activity = time.monotonic()
+            event = parser.feed_line(line)
+            if event is None:
+                continue
+            self.events += 1
+            event_type, event_id, data = event
+            try:
+                resume_id = await self._handler(event_type, event_id, data)
+            except Exception as e:
+                self.handler_failures += 1
+                logger.error(f"EventStreamClient '{self.name}': 处理事件失败: {e}", exc_info=True)
+                continue
+            if resume_id or event_id:
+                self.last_event_id = resume_id or event_id
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "events": self.events,
+            "heartbeat_timeouts": self.heartbeat_timeouts,
+            "failures": self.failures,
+            "handler_failures": self.handler_failures,
+            "last_event_id": self.last_event_id,
+            "seconds_since_activity": (time.monotonic() - self._last_activity) if self._last_activity else None,
+        }
@@ -0,0 +1,119 @@
+# vocechat_streaming.py
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from astrbot import logger
+
+
+class StreamingReply:
+    """把流式输出的文本写入同一条 VoceChat 消息。
+
+    第一段非空文本立即发送，之后的增量按 interval 合并为一次编辑，生成器停顿时也会在 interval 内显示最新内容。
+    发送没有返回消息 ID 或编辑失败时不再编辑，finish() 时把尚未显示的部分作为一条新消息发送
+    （首段发送成功但没有返回消息 ID 时首段已送达，不会重复发送）；
+    edit_enabled 为 False 时只在 finish() 时发送一次完整文本。
+    """
+
+    def __init__(
+        self,
+        post: Callable[[str], Awaitable[Optional[int]]],
+        edit: Callable[[int, str], Awaitable[bool]],
+        interval: float = 0.8,
+        edit_enabled: bool = True,
+        name: str = "",
+    ) -> None:
+        self._post = post
+        self._edit = edit
+        self.interval = max(0.0, float(interval))
+        self.editing = edit_enabled
+        self.name = name
+
+        self.text = ""
+        self.shown = ""  # 已显示在消息中的文本，总是 text 的前缀
+        self.mid: Optional[int] = None
+        self.started_at = time.perf_counter()
+        self.first_chunk_latency: Optional[float] = None
+        self.edits = 0
+        self.fell_back = False
+
+        self._last_edit = 0.0
+        self._lock = asyncio.Lock()
+        self._deferred: Optional[asyncio.Task] = None
+
+    async def append(self, text: str) -> None:
+        if not text:
+            return
+        self.text += text
+        if not self.editing:
+            return
+        if self.mid is None:
+            if not self.text.strip():
+                return  # 不发送只有空白的首段
+            async with self._lock:
+                if self.mid is None and self.editing:
+                    await self._post_first()
+            return
+        if time.perf_counter() - self._last_edit >= self.interval:
+            await self._flush()
+        elif self._deferred is None or self._deferred.done():
+            self._deferred = asyncio.create_task(self._flush_later())
+
+    async def _post_first(self) -> None:
+        text = self.text
+        try:
+            mid = await self._post(text)
+        except Exception as e:
+            logger.warning(f"StreamingReply '{self.name}': 发送首段流式消息失败，改为结束时一次发送: {e}")
+            self._fall_back()
+            return
+        # 请求成功即已送达；没有返回消息 ID 时无法编辑，之后的内容在 finish() 时作为新消息发送
+        self.shown = text
+        self._last_edit = time.perf_counter()
+        self.first_chunk_latency = self._last_edit - self.started_at
+        if mid is None:
+            self._fall_back()
+            return
+        self.mid = mid
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(max(0.0, self._last_edit + self.interval - time.perf_counter()))
+        await self._flush()
+
+    async def _flush(self) -> None:
+        async with self._lock:
+            if not self.editing or self.mid is None or self.text == self.shown:
+                return
+            text = self.text
+            try:
+                ok = await self._edit(self.mid, text)
+            except Exception as e:
+                logger.warning(f"StreamingReply '{self.name}': 编辑消息 {self.mid} 出错: {e}")
+                ok = False
+            self._last_edit = time.perf_counter()
+            if ok:
+                self.edits += 1
+                self.shown = text
+            else:
+                self._fall_back()
+
+    def _fall_back(self) -> None:
+        self.editing = False
+        self.fell_back = True
+
+    async def finish(self) -> None:
+        """提交最终文本：能编辑时做最后一次编辑，否则发送尚未显示的部分"""
+        if self._deferred is not None and not self._deferred.done():
+            self._deferred.cancel()
+            await asyncio.gather(self._deferred, return_exceptions=True)
+        self._deferred = None
+        await self._flush()
+        remainder = self.text[len(self.shown):]
+        if remainder.strip():
+            async with self._lock:
+                mid = await self._post(remainder)
+            if self.first_chunk_latency is None:
+                self.first_chunk_latency = time.perf_counter() - self.started_at
+            if self.mid is None:
+                self.mid = mid
+            self.shown = self.text
@@ -0,0 +1,119 @@
+# vocechat_trace.py
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+import weakref
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from astrbot import logger
+
+# VoceChatEvent.send 调用 send_by_session 期间的当前追踪，发送时据此记录各组件的 POST 时间
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("vocechat_current_trace", default=None)
+
+
+class Trace:
+    """一条消息从接收到回复的各阶段时间点（相对接收时刻的秒数）"""
+
+    __slots__ = ("trace_id", "started_at", "attrs", "marks", "duration", "_t0")
+
+    def __init__(self, trace_id: int) -> None:
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.attrs: Dict[str, Any] = {}
+        self.marks: List[Tuple[str, float]] = [("receive", 0.0)]
+        self.duration: Optional[float] = None
+        self._t0 = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        self.marks.append((stage, time.perf_counter() - self._t0))
+
+    def mark_once(self, stage: str) -> None:
+        if not any(name == stage for name, _ in self.marks):
+            self.mark(stage)
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages = []
+        previous = 0.0
+        for name, offset in self.marks:
+            stages.append({"stage": name, "at_ms": round(offset * 1000, 3), "delta_ms": round((offset - previous) * 1000, 3)})
+            previous = offset
+        return {
+            "id": self.trace_id,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            **self.attrs,
+            "stages": stages,
+        }
+
+
+class FlightRecorder:
+    """按 sample_rate 抽样追踪消息处理的各个阶段，只保留耗时最长的 keep 条。
+
+    追踪在事件对象被 AstrBot 释放（处理完成）时结束；未产生事件的消息在被忽略时结束。
+    未抽中的消息不创建 Trace，各处只做一次 None 判断。
+    """
+
+    def __init__(self, sample_rate: float = 0.1, keep: int = 50, name: str = "") -> None:
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.keep = max(1, int(keep))
+        self.name = name
+
+        self._ids = itertools.count(1)
+        self._slowest: List[Tuple[float, int, Trace]] = []  # 按耗时的小顶堆
+
+        self.sampled = 0
+        self.finished = 0
+
+    def start(self) -> Optional[Trace]:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return Trace(next(self._ids))
+
+    def watch(self, obj: Any, trace: Trace) -> None:
+        """obj 被释放时结束追踪"""
+        weakref.finalize(obj, self.finish, trace)
+
+    def finish(self, trace: Trace, stage: str = "done") -> None:
+        if trace.duration is not None:
+            return
+        trace.mark(stage)
+        trace.duration = trace.marks[-1][1]
+        self.finished += 1
+        entry = (trace.duration, trace.trace_id, trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif trace.duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """按耗时从长到短返回保留的追踪"""
+        return [trace.to_dict() for _, _, trace in sorted(self._slowest, key=lambda e: e[0], reverse=True)]
+
+    def dump(self, path: str) -> int:
+        """把保留的追踪以 JSONL 格式写入文件，返回写入的条数"""
+        traces = self.snapshot()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for trace in traces:
+                f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        logger.info(f"FlightRecorder '{self.name}': 已将 {len(traces)} 条最慢的消息追踪写入 {path}")
+        return len(traces)
+
+    def get_stats(self) -> Dict[str, Any]:
+        slowest = max(self._slowest, key=lambda e: e[0])[0] if self._slowest else 0.0
+        return {
+            "sample_rate": self.sample_rate,
+            "keep": self.keep,
+            "sampled": self.sampled,
+            "finished": self.finished,
+            "kept": len(self._slowest),
+            "slowest_ms": round(slowest * 1000, 3),
+        }